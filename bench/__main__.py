@@ -0,0 +1,221 @@
+"""
+Benchmarks of muddle against a local fake moodle server (see fakemoodle.py)
+
+    python -m bench                   # run and compare with bench/baseline.json
+    python -m bench --save-baseline   # run and store the results as the baseline
+
+Exits with status 1 if a result is worse than the baseline by more than
+the tolerance. Results are only compared with a baseline measured with the
+same parameters.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+from muddle import download
+from muddle import moodle
+
+from . import fakemoodle
+
+# the GUI model is benchmarked without a display (muddle.gui is imported
+# only by bench_model)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# name: (unit, which is better)
+METRICS = {
+    "walk.first_item": ("ms", "lower"),
+    "walk.total": ("s", "lower"),
+    "walk.peak_memory": ("MiB", "lower"),
+    "model.build": ("s", "lower"),
+    "download.throughput": ("MiB/s", "higher"),
+    "process.peak_rss": ("MiB", "lower"),
+}
+
+MiB = 1024 * 1024
+
+
+def bench_walk(url, args):
+    """ Returns the results and the items of a walk of the whole instance """
+    instance = moodle.MoodleInstance(url, "token", moodle.HttpPool(pool_size=2 * args.workers))
+
+    gc.collect()
+    start = time.perf_counter()
+    first = None
+    items = []
+    for item in instance.walk(instance.get_user_courses(), max_workers=args.workers):
+        if first is None:
+            first = time.perf_counter() - start
+        items.append(item)
+    total = time.perf_counter() - start
+
+    # a second time to measure the memory, tracemalloc slows everything down
+    tracemalloc.start()
+    try:
+        kept = list(instance.walk(instance.get_user_courses(), max_workers=args.workers))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del kept
+
+    return {"walk.first_item": first * 1000, "walk.total": total, "walk.peak_memory": peak / MiB}, items
+
+
+def bench_model(items, args):
+    """ Inserts the items in a MoodleTreeModel the way the window does """
+    try:
+        from PyQt6.QtWidgets import QApplication
+    except ImportError:
+        print("PyQt6 is not installed, skipping the model benchmark", file=sys.stderr)
+        return {}
+
+    app = QApplication.instance() or QApplication([])
+    from muddle import gui
+
+    # one batch per course, as sent by MoodleFetcher
+    batches = []
+    for kind, item in moodle.typed(items):
+        if kind == moodle.Kind.COURSE:
+            batches.append([])
+        batches[-1].append((gui.MoodleFetcher.itemTypes[kind], item))
+
+    model = gui.MoodleTreeModel(moodle.HttpPool())
+    proxy = gui.MoodleTreeFilterModel()
+    proxy.setRecursiveFilteringEnabled(True)
+    proxy.setDynamicSortFilter(True)
+    proxy.setSourceModel(model)
+    proxy.sort(0)
+    model.batchAboutToBeInserted.connect(proxy.suspendDynamicSortFilter)
+    model.batchInserted.connect(proxy.resumeDynamicSortFilter)
+
+    gc.collect()
+    start = time.perf_counter()
+    model.pendingBatches = batches
+    model.insertPendingBatches()
+    app.processEvents()
+    return {"model.build": time.perf_counter() - start}
+
+
+def bench_download(url, items, args):
+    """ Downloads the first files of the instance, about args.download MiB """
+    jobs = []
+    total = 0
+    directory = tempfile.TemporaryDirectory(prefix="muddle-bench-")
+    for kind, item in items:
+        if kind != moodle.Kind.CONTENT or total >= args.download * MiB:
+            continue
+        total += item["filesize"]
+        jobs.append(download.Download(url=item["fileurl"], path=download.local_path(directory.name, f"{len(jobs)}.pdf"),
+                                      size=item["filesize"], timemodified=item["timemodified"]))
+
+    api = moodle.RestApi(url, "token", moodle.HttpPool(pool_size=2 * args.workers))
+    downloader = download.Downloader(moodle.ApiHelper(api), max_workers=args.workers, per_host=args.workers)
+    with directory:
+        start = time.perf_counter()
+        failed = downloader.download(jobs)
+        elapsed = time.perf_counter() - start
+
+    if failed:
+        print(f"{len(failed)} downloads failed", file=sys.stderr)
+    return {"download.throughput": total / MiB / elapsed}
+
+
+def peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return {}
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, KiB everywhere else
+    return {"process.peak_rss": rss / MiB if sys.platform == "darwin" else rss / 1024}
+
+
+def best(runs):
+    """ The best value of every metric over the runs, the others are noise """
+    results = {}
+    for run in runs:
+        for name, value in run.items():
+            if name not in results:
+                results[name] = value
+            elif METRICS[name][1] == "lower":
+                results[name] = min(results[name], value)
+            else:
+                results[name] = max(results[name], value)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Prints the results next to the baseline, returns the names of the regressions """
+    regressions = []
+    for name, value in results.items():
+        unit, better = METRICS[name]
+        line = f"{name:<22} {value:10.2f} {unit:<6}"
+
+        old = baseline.get(name)
+        if old:
+            change = (value - old) / old
+            worse = change > tolerance if better == "lower" else change < -tolerance
+            line += f" baseline {old:10.2f} ({change:+.0%}){'  REGRESSION' if worse else ''}"
+            if worse:
+                regressions.append(name)
+        print(line)
+
+    return regressions
+
+
+parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks of muddle against a fake moodle server")
+parser.add_argument("--courses", help="number of courses (default: 200)", type=int, default=200)
+parser.add_argument("--files", help="total number of files (default: 50000)", type=int, default=50000)
+parser.add_argument("--latency", help="latency of every request in ms (default: 20)", type=float, default=20)
+parser.add_argument("--jitter", help="random latency added to every request in ms (default: 10)", type=float, default=10)
+parser.add_argument("--workers", help="concurrent requests and downloads (default: 4)", type=int, default=4)
+parser.add_argument("--download", help="MiB to download (default: 64)", type=float, default=64)
+parser.add_argument("--repeat", help="run everything this many times and keep the best (default: 3)", type=int, default=3)
+parser.add_argument("--baseline", help="baseline file (default: bench/baseline.json)",
+                    default=os.path.join(os.path.dirname(__file__), "baseline.json"))
+parser.add_argument("--save-baseline", help="store the results as the baseline", action="store_true")
+parser.add_argument("--tolerance", help="allowed slowdown before reporting a regression (default: 0.25)", type=float, default=0.25)
+args = parser.parse_args()
+
+parameters = {name: getattr(args, name) for name in ("courses", "files", "latency", "jitter", "workers", "download")}
+instance = fakemoodle.Instance(courses=args.courses, files=args.files)
+
+runs = []
+with fakemoodle.FakeMoodle(instance, latency=args.latency / 1000, jitter=args.jitter / 1000) as server:
+    for run in range(args.repeat):
+        results, items = bench_walk(server.url, args)
+        results.update(bench_model(items, args))
+        results.update(bench_download(server.url, items, args))
+        runs.append(results)
+        print(f"run {run + 1}/{args.repeat}: {sum(1 for kind, _ in items if kind == moodle.Kind.CONTENT)} files",
+              file=sys.stderr)
+
+results = best(runs)
+results.update(peak_rss())
+
+baseline = {}
+try:
+    with open(args.baseline) as f:
+        stored = json.load(f)
+    if stored["parameters"] == parameters:
+        baseline = stored["results"]
+    else:
+        print(f"the baseline was measured with {stored['parameters']}, not comparing", file=sys.stderr)
+except FileNotFoundError:
+    print(f"no baseline in {args.baseline}", file=sys.stderr)
+
+regressions = compare(results, baseline, args.tolerance)
+
+if args.save_baseline:
+    with open(args.baseline, "w") as f:
+        json.dump({"parameters": parameters, "machine": f"{platform.machine()} {platform.system()}",
+                   "python": platform.python_version(), "results": results}, f, indent=1)
+    print(f"saved the baseline to {args.baseline}", file=sys.stderr)
+elif regressions:
+    sys.exit(1)
@@ -0,0 +1,201 @@
+"""
+A stand-in for the REST api and pluginfile.php of a moodle instance, that
+serves a synthetic instance from memory with an optional latency
+"""
+import re
+import json
+import time
+import random
+import threading
+import http.server
+import urllib.parse
+
+
+WORDS = ("linear algebra analysis signals systems physics electronics control thermodynamics "
+         "probability statistics networks programming databases optics mechanics fields "
+         "exercise solution lecture slides notes exam summary chapter week lab project").split()
+
+
+class Instance:
+    """
+    Courses with sections, modules and files, generated deterministically
+    from seed. files is the total number of files, they are spread evenly
+    over the courses (sections per course, files per module).
+    """
+
+    def __init__(self, courses=200, files=50000, sections=10, files_per_module=5, seed=0,
+                 min_size=16 * 1024, max_size=2 * 1024 * 1024):
+        self.seed = seed
+        rng = random.Random(seed)
+        self.modules_per_section = max(1, files // (courses * sections * files_per_module))
+        self.courses = [{
+            "id": c + 1,
+            "shortname": f"C{c + 1:04d}",
+            "fullname": Instance.title(rng, 3).title(),
+            "summary": f"<p>{Instance.title(rng, 12)}</p>",
+        } for c in range(courses)]
+        self.sections = sections
+        self.files_per_module = files_per_module
+        self.min_size = min_size
+        self.max_size = max_size
+
+        # filled by contents(), the size of every file by its path
+        self.files = {}
+        self._contents = {}
+
+    @staticmethod
+    def title(rng, words):
+        return " ".join(rng.choice(WORDS) for _ in range(words))
+
+    def contents(self, base_url, courseid):
+        """ Returns the response of core_course_get_contents for a course (as bytes) """
+        if courseid in self._contents:
+            return self._contents[courseid]
+
+        # the same for a course whatever the order of the requests
+        rng = random.Random(self.seed * 1000003 + courseid)
+        sections = []
+        for s in range(self.sections):
+            modules = []
+            for m in range(self.modules_per_section):
+                cmid = (courseid * self.sections + s) * self.modules_per_section + m
+                contents = []
+                for f in range(self.files_per_module):
+                    path = f"/webservice/pluginfile.php/{cmid}/mod_resource/content/0/file{f}.pdf"
+                    size = rng.randint(self.min_size, self.max_size)
+                    self.files[path] = size
+                    contents.append({
+                        "type": "file",
+                        "filename": f"{Instance.title(rng, 2)} {f}.pdf",
+                        "filepath": "/",
+                        "filesize": size,
+                        "fileurl": f"{base_url}{path}",
+                        "timemodified": 1600000000 + cmid,
+                        "mimetype": "application/pdf",
+                    })
+                modules.append({
+                    "id": cmid,
+                    "url": f"{base_url}/mod/resource/view.php?id={cmid}",
+                    "name": Instance.title(rng, 4).capitalize(),
+                    "modname": "resource",
+                    "description": f"<p>{Instance.title(rng, 20)}</p>",
+                    "contents": contents,
+                })
+            sections.append({
+                "id": courseid * self.sections + s,
+                "name": f"Week {s + 1}",
+                "section": s,
+                "summary": f"<p>{Instance.title(rng, 10)}</p>",
+                "modules": modules,
+            })
+
+        body = self._contents[courseid] = json.dumps(sections).encode()
+        return body
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode())
+        path = urllib.parse.urlsplit(self.path).path
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        if path.startswith("/webservice/pluginfile.php/"):
+            return self.file(path)
+
+        if path != "/webservice/rest/server.php":
+            return self.send(404, b"not found", "text/plain")
+
+        function = form.get("wsfunction", [""])[0]
+        instance = server.instance
+        if function == "core_webservice_get_site_info":
+            body = json.dumps({"userid": 2, "sitename": "Fake Moodle", "username": "bench"}).encode()
+        elif function == "core_enrol_get_users_courses":
+            body = json.dumps(instance.courses).encode()
+        elif function == "core_course_get_contents":
+            with server.lock:
+                body = instance.contents(server.url, int(form["courseid"][0]))
+        else:
+            body = json.dumps({"exception": "moodle_exception", "errorcode": "invalidrecord",
+                               "message": f"{function} is not implemented by the fake server"}).encode()
+
+        self.send(200, body)
+
+    def file(self, path):
+        size = self.server.instance.files.get(path)
+        if size is None:
+            return self.send(404, b"not found", "text/plain")
+
+        start, end = 0, size - 1
+        status, headers = 200, [("Accept-Ranges", "bytes")]
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            if start >= size:
+                return self.send(416, b"", headers=[("Content-Range", f"bytes */{size}")])
+            status = 206
+            headers.append(("Content-Range", f"bytes {start}-{end}/{size}"))
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(end - start + 1))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+        chunk = bytes(64 * 1024)
+        remaining = end - start + 1
+        while remaining > 0:
+            n = min(remaining, len(chunk))
+            self.wfile.write(chunk[:n])
+            remaining -= n
+
+
+class FakeMoodle:
+    """
+    Serves instance on a free local port in a background thread, every
+    request waits latency seconds plus a random jitter. Use as a context
+    manager, url is the url of the instance.
+    """
+
+    def __init__(self, instance, latency=0.0, jitter=0.0):
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.instance = instance
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.lock = threading.Lock()
+        self.httpd.url = self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        # generate everything now, not while it is being measured
+        for course in instance.courses:
+            instance.contents(self.url, course["id"])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
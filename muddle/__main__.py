@@ -1,19 +1,31 @@
 #!/usr/bin/env python3
 
-import argparse
-import configparser
-import logging
-import colorlog
+import time
+# for --startup-profile
+start_time = time.perf_counter()
 
-import os
-import sys
-import platform
-import pathlib
-import json
+import argparse  # noqa: E402
+import atexit  # noqa: E402
+import configparser  # noqa: E402
+import logging  # noqa: E402
+import colorlog  # noqa: E402
 
-from . import moodle
-from . import gui
-from . import paths
+import os  # noqa: E402
+import sys  # noqa: E402
+import platform  # noqa: E402
+import pathlib  # noqa: E402
+import json  # noqa: E402
+import threading  # noqa: E402
+
+from . import cache  # noqa: E402
+from . import catalog  # noqa: E402
+from . import download  # noqa: E402
+from . import fulltext  # noqa: E402
+from . import metrics  # noqa: E402
+from . import moodle  # noqa: E402
+from . import paths  # noqa: E402
+from . import sync  # noqa: E402
+from . import trace  # noqa: E402
 
 
 MUDDLE_VERSION = "0.1.0"
@@ -26,6 +38,33 @@ parser.add_argument("-v", "--verbose", help="be more verbose", action="store_tru
 parser.add_argument("-c", "--config", help="configuration file", type=str)
 parser.add_argument("-l", "--logfile", help="where to save logs", type=str)
 parser.add_argument("-V", "--version", help="version", action="store_true")
+parser.add_argument("--startup-profile", help="print how long the phases of the startup take", action="store_true")
+parser.add_argument("--stats", help="write statistics of the api calls and downloads as JSON to this file on exit", type=str)
+parser.add_argument("--trace", help="record a trace of the api calls, decoding and tree updates and write it to this file on exit (open it in chrome://tracing or ui.perfetto.dev)", type=str)
+
+subparsers = parser.add_subparsers(dest="command")
+
+sync_parser = subparsers.add_parser("sync", help="download the files of the courses without graphical interface")
+sync_parser.add_argument("directory", help="where to download the files (default: default_download_dir in the config)", nargs="?")
+sync_parser.add_argument("-C", "--course", help="only courses whose id, short or full name match the glob (repeatable)", action="append")
+sync_parser.add_argument("-i", "--include", help="only files whose path in the directory matches the glob (repeatable)", action="append")
+sync_parser.add_argument("-x", "--exclude", help="skip files whose path in the directory matches the glob (repeatable)", action="append")
+sync_parser.add_argument("-j", "--jobs", help="number of concurrent downloads (default: max_workers and per_host in [download])", type=int)
+sync_parser.add_argument("-n", "--dry-run", help="only list the files that would be downloaded", action="store_true")
+sync_parser.add_argument("--json", help="print progress as JSON lines on stdout", action="store_true")
+
+files_parser = subparsers.add_parser("files", help="list the files in the catalog of the last refresh or sync, without network")
+files_parser.add_argument("-s", "--since", help="only files modified in the last N days", type=float)
+files_parser.add_argument("-t", "--type", help="only files with this extension, for example pdf")
+files_parser.add_argument("-C", "--course", help="only courses whose id or short name match the glob (repeatable)", action="append")
+files_parser.add_argument("-l", "--limit", help="maximum number of files", type=int)
+files_parser.add_argument("--json", help="print the files as JSON lines", action="store_true")
+
+search_parser = subparsers.add_parser("search", help="search the summaries and downloaded files in the full-text index")
+search_parser.add_argument("query", help="words to search, matched as prefixes", nargs="+")
+search_parser.add_argument("-l", "--limit", help="maximum number of results (default: 20)", type=int, default=20)
+search_parser.add_argument("--json", help="print the results as JSON lines", action="store_true")
+
 args = parser.parse_args()
 
 # L O G G I N G
@@ -98,6 +137,199 @@ config.add_section("runtime_data")
 config["runtime_data"]["config_path"] = str(config_file)
 
 
+# P R O F I L E
+
+class StartupProfile:
+    """ Measures the time spent in every phase of the startup """
+    def __init__(self, start):
+        self.last = start
+        self.start = start
+        self.phases = []
+
+    def mark(self, phase):
+        """ Ends the phase that started at the last mark """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        for phase, duration in self.phases:
+            print(f"{phase:<24} {duration * 1000:8.1f} ms", file=sys.stderr)
+        print(f"{'total':<24} {(self.last - self.start) * 1000:8.1f} ms", file=sys.stderr)
+
+        qt = sorted(m for m in sys.modules if m.startswith("PyQt6.Qt"))
+        print(f"Qt modules loaded: {', '.join(qt) or 'none'}", file=sys.stderr)
+
+
+profile = StartupProfile(start_time) if args.startup_profile else None
+if profile:
+    profile.mark("imports and arguments")
+
+if args.stats:
+    atexit.register(metrics.registry.dump, args.stats)
+
+if args.trace:
+    trace.start()
+    atexit.register(trace.save, args.trace)
+
+
+# S Y N C
+
+class SyncReporter:
+    """ Prints the progress of a sync, as text or as JSON lines """
+    def __init__(self, as_json):
+        self.as_json = as_json
+        self.lock = threading.Lock()
+        self.files = 0
+        self.files_done = 0
+        self.bytes = 0
+        self.bytes_done = 0
+        self.last_progress = 0
+
+    def emit(self, event, text, **data):
+        with self.lock:
+            if self.as_json:
+                print(json.dumps({"event": event, **data}), flush=True)
+            elif text:
+                print(text, flush=True)
+
+    def on_start(self, outdated, skipped):
+        self.files = len(outdated)
+        self.bytes = sum(job.size or 0 for job in outdated)
+        self.emit("start", f"downloading {self.files} files, {len(skipped)} are up to date",
+                  files=self.files, skipped=len(skipped), bytes=self.bytes)
+
+    def on_bytes(self, job, n):
+        with self.lock:
+            self.bytes_done += n
+            now = time.monotonic()
+            if now - self.last_progress < 1:
+                return
+            self.last_progress = now
+
+        self.emit("progress", None, files_done=self.files_done, files=self.files,
+                  bytes_done=self.bytes_done, bytes=self.bytes)
+
+    def on_done(self, job, error):
+        with self.lock:
+            self.files_done += 1
+
+        if error is None:
+            self.emit("done", f"[{self.files_done}/{self.files}] {job.path}",
+                      path=str(job.path), url=job.url, size=job.size)
+        else:
+            self.emit("failed", f"[{self.files_done}/{self.files}] failed {job.path}: {error}",
+                      path=str(job.path), url=job.url, error=str(error))
+
+
+def sync_command(args, config):
+    directory = args.directory or config.get("muddle", "default_download_dir", fallback=None)
+    if not directory:
+        log.error("no directory given and no default_download_dir in the config")
+        return 2
+
+    url = config.get("server", "url", fallback="").strip()
+    token = config.get("server", "token", fallback="").strip()
+    if not url or not token:
+        log.error("no url or token in the [server] section of the config")
+        return 2
+
+    directory = pathlib.Path(directory).expanduser()
+    instance = moodle.MoodleInstance(
+        url, token,
+        moodle.HttpPool.from_config(config), cache.ResponseCache.from_config(config),
+        catalog=catalog.Catalog.from_config(config))
+
+    courses = instance.get_user_courses()
+    if courses is None:
+        return 1
+
+    if args.course:
+        courses = sync.filter_courses(courses, args.course)
+
+    failed_courses = []
+
+    def check(items):
+        for kind, item in items:
+            if kind == moodle.Kind.COURSE and item["timesynced"] is None:
+                failed_courses.append(item["shortname"])
+            yield kind, item
+
+    items = instance.walk(courses, max_workers=config.getint("http", "max_workers", fallback=4))
+    index = fulltext.FullTextIndex.from_config(config)
+    if index:
+        items = index.indexed(items)
+    jobs = sync.filter_jobs(sync.collect_jobs(directory, check(items)), directory, args.include, args.exclude)
+    manifest = sync.Manifest(directory)
+    reporter = SyncReporter(args.json)
+
+    if args.dry_run:
+        for job in manifest.outdated(list(jobs)):
+            reporter.emit("outdated", str(job.path), path=str(job.path), url=job.url, size=job.size)
+        return 1 if failed_courses else 0
+
+    downloader = download.Downloader.from_config(moodle.ApiHelper(instance.api), config)
+    if args.jobs:
+        # all the files come from the same server
+        downloader.max_workers = downloader.per_host = args.jobs
+
+    def on_done(job, error):
+        if error is None and index:
+            index.add_file(job)
+        reporter.on_done(job, error)
+
+    failed, skipped = sync.mirror(downloader, manifest, jobs, reporter.on_bytes, on_done, reporter.on_start)
+
+    for shortname in failed_courses:
+        log.error(f"could not get the contents of {shortname}, its files were not synced")
+
+    reporter.emit("finished", f"{reporter.files_done - len(failed)} downloaded, {len(failed)} failed, {len(skipped)} up to date",
+                  downloaded=reporter.files_done - len(failed), failed=len(failed), skipped=len(skipped),
+                  failed_courses=failed_courses)
+
+    return 1 if failed or failed_courses else 0
+
+
+def files_command(args, config):
+    store = catalog.Catalog.from_config(config)
+    if not store:
+        log.error("the catalog is disabled in [catalog]")
+        return 2
+
+    courses = None
+    if args.course:
+        courses = [course["id"] for course in sync.filter_courses(store.courses(), args.course)]
+
+    since = time.time() - args.since * 24 * 60 * 60 if args.since is not None else None
+    for f in store.files(since=since, suffix=args.type, courses=courses, limit=args.limit):
+        if args.json:
+            print(json.dumps(f))
+        else:
+            modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(f["timemodified"] or 0))
+            print(f"{modified}  {f['course']:<12} {f['title']}")
+
+    return 0
+
+
+def search_command(args, config):
+    index = fulltext.FullTextIndex.from_config(config)
+    if not index:
+        log.error("the full-text index is not enabled, set enabled = true in [fulltext]")
+        return 2
+
+    results = index.search(" ".join(args.query), limit=args.limit)
+    for result in results:
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{result['kind']:<8} {result['title']}" + (f" ({result['course']})" if result["course"] else ""))
+            if result["location"]:
+                print(f"         {result['location']}")
+            print(f"         {result['snippet']}".replace("\n", " "))
+
+    return 0 if results else 1
+
+
 # S T A R T
 
 if args.version:
@@ -109,5 +341,22 @@ are welcome to redistribute it under certain conditions; see LICENSE.txt for
 details. Project repository: https://github.com/NaoPross/Muddle
 """)
 
-if args.gui or config.getboolean("muddle", "always_run_gui"):
-    gui.start(config)
+if profile:
+    profile.mark("parse config")
+
+if args.command == "sync":
+    sys.exit(sync_command(args, config))
+
+if args.command == "files":
+    sys.exit(files_command(args, config))
+
+if args.command == "search":
+    sys.exit(search_command(args, config))
+
+if args.gui or config.getboolean("muddle", "always_run_gui", fallback=False):
+    # imported only here, loading Qt is slow and needs a display
+    from . import gui
+    gui.start(config, profile)
+
+if profile:
+    profile.report()
@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import pathlib
+import shutil
+import tempfile
+import threading
+import concurrent.futures
+
+import requests
+
+from . import download
+from . import paths
+
+log = logging.getLogger("muddle.cache")
+
+
+class ResponseCache:
+    """
+    On-disk cache of REST api responses
+
+    Responses are keyed by the instance url, the token, the wsfunction and
+    its parameters, so that a different account does not get the responses
+    of the previous one. The key is a hash, the token is not stored. Each
+    function has its own time to live, functions without one are never
+    cached. When the total size of
+    the cache exceeds max_size the least recently used responses are
+    removed.
+    """
+
+    # in seconds, can be overridden in the [cache.ttl] section of the config
+    default_ttls = {
+        "core_webservice_get_site_info": 24 * 60 * 60,
+        "core_enrol_get_users_courses": 60 * 60,
+        "core_course_get_contents": 10 * 60,
+    }
+
+    def __init__(self, directory=None, max_size=64 * 1024 * 1024, ttls=None,
+                 stale_while_revalidate=False):
+        self.directory = pathlib.Path(directory or paths.default_cache_dir.joinpath("responses"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.ttls = dict(ResponseCache.default_ttls)
+        self.ttls.update(ttls or {})
+        self.stale_while_revalidate = stale_while_revalidate
+
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self.directory.glob("*.json"))
+
+        # background revalidation of stale responses
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self._revalidating = set()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates a cache using the [cache] and [cache.ttl] sections of the
+        config, returns None if caching is not enabled
+        """
+        if not config.getboolean("cache", "enabled", fallback=False):
+            return None
+
+        ttls = {}
+        if config.has_section("cache.ttl"):
+            ttls = {k: config.getint("cache.ttl", k) for k in config["cache.ttl"]}
+
+        return cls(
+            directory=config.get("cache", "directory", fallback=None),
+            max_size=config.getint("cache", "max_size", fallback=64) * 1024 * 1024,
+            ttls=ttls,
+            stale_while_revalidate=config.getboolean("cache", "stale_while_revalidate", fallback=False))
+
+    def is_cacheable(self, function):
+        return self.ttls.get(function, 0) > 0
+
+    @staticmethod
+    def key(url, token, function, params):
+        """ Computes the key of a call, params must not contain the token """
+        data = json.dumps([url, token, function, sorted(params.items())], default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _path(self, key):
+        return self.directory.joinpath(f"{key}.json")
+
+    def get(self, key):
+        """
+        Returns a tuple (body, age) of the cached response or None if there
+        is no entry for the key
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                body = f.read()
+            # mark as recently used for the LRU eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return body, time.time() - header["time"]
+
+    def put(self, key, function, body):
+        """ Stores a response body, unless it contains a moodle exception """
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return
+
+        if isinstance(data, dict) and "exception" in data:
+            return
+
+        header = json.dumps({"time": time.time(), "function": function}).encode()
+        path = self._path(key)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(header + b"\n" + body)
+
+            with self._lock:
+                if path.exists():
+                    self._size -= path.stat().st_size
+                os.replace(tmp, path)
+                self._size += path.stat().st_size
+        except OSError as e:
+            log.warning(f"failed to write cache entry for {function}: {e}")
+            return
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache fits max_size """
+        with self._lock:
+            entries = []
+            for path in self.directory.glob("*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            self._size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if self._size <= self.max_size:
+                    break
+                try:
+                    path.unlink()
+                    self._size -= size
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            for path in self.directory.glob("*.json"):
+                path.unlink()
+            self._size = 0
+
+    def lookup(self, url, token, function, params, fetch):
+        """
+        Returns the response for a call, from the cache if it is still fresh.
+        fetch is called without arguments to perform the actual request. In
+        stale-while-revalidate mode expired responses are returned
+        immediately and fetch is called in the background.
+        """
+        key = ResponseCache.key(url, token, function, params)
+        cached = self.get(key)
+
+        if cached:
+            body, age = cached
+            if age < self.ttls[function]:
+                log.debug(f"cache hit for {function} (age {age:.0f}s)")
+                return ResponseCache.response(url, body, age)
+
+            if self.stale_while_revalidate:
+                log.debug(f"stale cache hit for {function}, revalidating")
+                self.revalidate(key, function, fetch)
+                return ResponseCache.response(url, body, age)
+
+        req = fetch()
+        if req is not None and req.ok:
+            self.put(key, function, req.content)
+
+        return req
+
+    def revalidate(self, key, function, fetch):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def task():
+            try:
+                req = fetch()
+                if req is not None and req.ok:
+                    self.put(key, function, req.content)
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        self._executor.submit(task)
+
+    @staticmethod
+    def response(url, body, age=0.0):
+        """
+        Wraps a cached body to look like the response of requests, age is
+        the number of seconds since it was received from the server
+        """
+        req = requests.Response()
+        req.status_code = 200
+        req.url = url
+        req.encoding = "utf-8"
+        req.headers["Content-Type"] = "application/json"
+        req._content = body
+        req.from_cache = True
+        req.age = age
+        return req
+
+
+class PreviewCache:
+    """
+    Files opened from the tree, kept on disk so that opening them again does
+    not download them again
+
+    Files are keyed by their url and modification time on moodle, so that a
+    file that changed is downloaded again. When the total size exceeds
+    max_size the least recently opened files are removed.
+    """
+
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024):
+        self.directory = pathlib.Path(directory or paths.default_cache_dir.joinpath("previews"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """ Creates a cache using the preview_max_size option of the [cache] section """
+        return cls(max_size=config.getint("cache", "preview_max_size", fallback=256) * 1024 * 1024)
+
+    def path(self, url, timemodified, filename):
+        """
+        Returns where the file is stored, every file has its own directory
+        so that it keeps its name (and the application to open it with)
+        """
+        key = hashlib.sha256(json.dumps([url, timemodified]).encode()).hexdigest()[:32]
+        return self.directory.joinpath(key, download.safe_filename(filename))
+
+    def get(self, url, timemodified, filename):
+        """ Returns the path of the file if it is in the cache, otherwise None """
+        path = self.path(url, timemodified, filename)
+        try:
+            # mark as recently used for the LRU eviction
+            os.utime(path)
+        except OSError:
+            return None
+
+        return path
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used files until the cache fits max_size,
+        except the file keep and files that are being downloaded
+        """
+        with self._lock:
+            entries = []
+            for entry in self.directory.iterdir():
+                try:
+                    files = [(f.name, f.stat()) for f in entry.iterdir()]
+                except OSError:
+                    continue
+                mtime = max((s.st_mtime for _, s in files), default=0)
+                # partial downloads (see ApiHelper.get_file) that may still be running
+                if mtime > time.time() - 60 and any(".part" in name for name, _ in files):
+                    continue
+                entries.append((mtime, sum(s.st_size for _, s in files), entry))
+
+            size = sum(size for _, size, _ in entries)
+            for _, entry_size, entry in sorted(entries):
+                if size <= self.max_size:
+                    break
+                if keep and keep.parent == entry:
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+                size -= entry_size
@@ -0,0 +1,213 @@
+import time
+import sqlite3
+import hashlib
+import logging
+import pathlib
+import threading
+
+from . import paths
+from .moodle import Kind
+
+log = logging.getLogger("muddle.catalog")
+
+
+class Catalog:
+    """
+    SQLite database of the courses, sections, modules and contents of an
+    instance, written by MoodleInstance.walk and read by the GUI and CLI
+
+    Every row has a key ("kind:id", contents are identified by their module
+    and file name), the key of its parent, the id of the course it belongs
+    to, its position among its siblings and the fields needed to rebuild
+    the dictionaries of the REST api.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # the connection is shared by the threads of MoodleInstance.walk
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            # the GUI and the CLI may use the catalog at the same time
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    key TEXT PRIMARY KEY,
+                    parent TEXT,
+                    course INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    type TEXT,
+                    position INTEGER NOT NULL,
+                    id INTEGER,
+                    title TEXT,
+                    url TEXT,
+                    size INTEGER,
+                    timemodified INTEGER,
+                    synced REAL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS items_parent ON items (parent, position)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS items_course ON items (course)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS items_timemodified ON items (timemodified)")
+
+    @staticmethod
+    def default_path(instance_url):
+        """ Every instance has its own catalog """
+        key = hashlib.sha1(instance_url.encode()).hexdigest()[:16]
+        return paths.default_cache_dir.joinpath("catalogs", f"{key}.sqlite3")
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Opens the catalog of the instance in the [server] section if it is
+        enabled in the [catalog] section of the config
+        """
+        if not config.getboolean("catalog", "enabled", fallback=False) or not config.has_option("server", "url"):
+            return None
+
+        try:
+            return cls(Catalog.default_path(config["server"]["url"]))
+        except sqlite3.Error as e:
+            log.error(f"cannot open the catalog: {e}")
+            return None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def key(kind, ident):
+        return f"{kind.value}:{ident}"
+
+    def _insert(self, key, parent, course, kind, position, item, now):
+        if kind == Kind.COURSE:
+            row = (None, item["id"], item.get("shortname"), None, None, None)
+        elif kind == Kind.SECTION:
+            row = (None, item["id"], item.get("name"), None, None, None)
+        elif kind == Kind.MODULE:
+            row = (item.get("modname"), item["id"], item.get("name"), item.get("url"), None, None)
+        else:
+            row = (item.get("type"), None, item.get("filename"), item.get("fileurl"),
+                   item.get("filesize"), item.get("timemodified"))
+
+        self._db.execute("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (key, parent, course, kind.value, row[0], position, *row[1:], now))
+
+    def store_courses(self, courses):
+        """
+        Stores the courses (as returned by core_enrol_get_users_courses)
+        without their contents. The courses that are not in the list anymore
+        (the user is not enrolled in them) are removed with their contents.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            ids = set(course["id"] for course in courses)
+            stored = [row[0] for row in self._db.execute("SELECT DISTINCT course FROM items")]
+            self._db.executemany("DELETE FROM items WHERE course = ?", [(c,) for c in stored if c not in ids])
+            for position, course in enumerate(courses):
+                self._insert(Catalog.key(Kind.COURSE, course["id"]), None, course["id"],
+                             Kind.COURSE, position, course, now)
+
+    def store_course(self, course, sections, incremental=False):
+        """
+        Stores the contents of a course as returned by core_course_get_contents.
+        If incremental is true sections contain only the modules that changed,
+        the other modules that are stored are kept.
+        """
+        now = time.time()
+        courseid = course["id"]
+        course_key = Catalog.key(Kind.COURSE, courseid)
+
+        with self._lock, self._db:
+            row = self._db.execute("SELECT position FROM items WHERE key = ?", (course_key,)).fetchone()
+            if not incremental:
+                self._db.execute("DELETE FROM items WHERE course = ?", (courseid,))
+            self._insert(course_key, None, courseid, Kind.COURSE, row[0] if row else 0, course, now)
+
+            for position, section in enumerate(sections):
+                section_key = Catalog.key(Kind.SECTION, section["id"])
+                # in incremental mode not all sections are there
+                position = section.get("section", position)
+                self._insert(section_key, course_key, courseid, Kind.SECTION, position, section, now)
+
+                for position, module in enumerate(section.get("modules", [])):
+                    module_key = Catalog.key(Kind.MODULE, module["id"])
+                    if incremental:
+                        # the changed modules keep their place among the others
+                        row = self._db.execute("SELECT position FROM items WHERE key = ?", (module_key,)).fetchone()
+                        position = row[0] if row else position
+                        self._db.execute("DELETE FROM items WHERE parent = ?", (module_key,))
+                    self._insert(module_key, section_key, courseid, Kind.MODULE, position, module, now)
+
+                    for position, content in enumerate(module.get("contents", [])):
+                        name = f"{content.get('filepath', '/')}{content.get('filename')}"
+                        self._insert(Catalog.key(Kind.CONTENT, f"{module['id']}:{name}"), module_key, courseid,
+                                     Kind.CONTENT, position, content, now)
+
+    @staticmethod
+    def todict(row):
+        """ Converts a row into a dictionary like the ones of the REST api """
+        kind = Kind(row["kind"])
+        if kind == Kind.COURSE:
+            return kind, {"id": row["id"], "shortname": row["title"]}
+        elif kind == Kind.SECTION:
+            return kind, {"id": row["id"], "name": row["title"]}
+        elif kind == Kind.MODULE:
+            return kind, {"id": row["id"], "name": row["title"], "modname": row["type"], "url": row["url"]}
+
+        # the key ends with the filepath and the filename
+        name = row["key"].split(":", 2)[2]
+        filepath = name[:-len(row["title"])] if row["title"] and name.endswith(row["title"]) else "/"
+        return kind, {"type": row["type"], "filename": row["title"], "filepath": filepath, "fileurl": row["url"],
+                      "filesize": row["size"], "timemodified": row["timemodified"]}
+
+    def walk(self):
+        """ Yields the stored items as (Kind, dict) tuples, in the same order as MoodleInstance.walk """
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM items").fetchall()
+
+        children = {}
+        for row in rows:
+            children.setdefault(row["parent"], []).append(row)
+
+        stack = sorted(children.get(None, []), key=lambda r: r["position"], reverse=True)
+        while stack:
+            row = stack.pop()
+            yield Catalog.todict(row)
+            stack.extend(sorted(children.get(row["key"], []), key=lambda r: r["position"], reverse=True))
+
+    def courses(self):
+        """ Returns the stored courses as dictionaries with id and shortname """
+        with self._lock:
+            rows = self._db.execute("SELECT id, title FROM items WHERE kind = 'course' ORDER BY position").fetchall()
+        return [{"id": row["id"], "shortname": row["title"]} for row in rows]
+
+    def files(self, since=None, suffix=None, courses=None, limit=None):
+        """
+        Returns the files (contents of type file) as dictionaries with the
+        keys course, title, url, size and timemodified, the most recently
+        modified first. since is a timestamp, suffix a file extension
+        (without dot) and courses a list of course ids.
+        """
+        query = """
+            SELECT c.title AS course, f.title, f.url, f.size, f.timemodified
+            FROM items f JOIN items c ON c.key = 'course:' || f.course
+            WHERE f.kind = 'content' AND f.type = 'file'"""
+        params = []
+        if since is not None:
+            query += " AND f.timemodified >= ?"
+            params.append(since)
+        if suffix:
+            query += " AND f.title LIKE ?"
+            params.append(f"%.{suffix}")
+        if courses is not None:
+            query += f" AND f.course IN ({', '.join('?' * len(courses))})"
+            params.extend(courses)
+        query += " ORDER BY f.timemodified DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            return [dict(row) for row in self._db.execute(query, params)]
@@ -0,0 +1,121 @@
+import os
+import re
+import logging
+import pathlib
+import threading
+import dataclasses
+import urllib.parse
+import concurrent.futures
+
+log = logging.getLogger("muddle.download")
+
+
+def safe_filename(name):
+    """ Replaces the characters that are not allowed in file names """
+    name = re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", name).strip(". ")
+    return name or "_"
+
+
+def local_path(root, *parts):
+    """ Joins the (sanitized) names of the items of the tree to root """
+    return pathlib.Path(root).joinpath(*(safe_filename(p) for p in parts))
+
+
+def filepath_parts(filepath):
+    """
+    Splits the filepath of a file of moodle (the directory of the file in
+    its module, e.g. "/week1/") into directory names
+    """
+    return [part for part in (filepath or "/").split("/") if part]
+
+
+@dataclasses.dataclass
+class Download:
+    """
+    A file to download, size and timemodified are the values reported by
+    moodle (they may be None if unknown)
+    """
+    url: str
+    path: pathlib.Path
+    size: int = None
+    timemodified: int = None
+
+
+class Downloader:
+    """
+    Downloads files with ApiHelper.get_file on a pool of threads, with at
+    most per_host concurrent downloads from the same server
+    """
+    def __init__(self, apihelper, max_workers=4, per_host=4, segments=1,
+                 segment_threshold=64 * 1024 * 1024):
+        self.apihelper = apihelper
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def from_config(cls, apihelper, config):
+        """ Creates a downloader using the [download] section of the config """
+        return cls(apihelper,
+                   max_workers=config.getint("download", "max_workers", fallback=4),
+                   per_host=config.getint("download", "per_host", fallback=4),
+                   segments=config.getint("download", "segments", fallback=1),
+                   segment_threshold=config.getint("download", "segment_threshold", fallback=64) * 1024 * 1024)
+
+    def _host_semaphore(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def cancel(self):
+        """ Downloads that have not started yet will not be started """
+        self._cancelled.set()
+
+    def _download(self, job, on_bytes):
+        if self._cancelled.is_set():
+            raise concurrent.futures.CancelledError()
+
+        with self._host_semaphore(job.url):
+            os.makedirs(job.path.parent, exist_ok=True)
+            self.apihelper.get_file(job.url, job.path, progress=lambda n: on_bytes(job, n),
+                                    filesize=job.size, timemodified=job.timemodified,
+                                    segments=self.segments, segment_threshold=self.segment_threshold)
+
+    def download(self, jobs, on_bytes=None, on_done=None):
+        """
+        Downloads all jobs and returns the list of jobs that failed.
+
+        on_bytes(job, n) is called when n bytes of a job were received and
+        on_done(job, error) when a job is finished, error is None if it was
+        successful. Both are called from the worker threads.
+        """
+        on_bytes = on_bytes or (lambda job, n: None)
+        failed = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._download, job, on_bytes): job for job in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                    error = None
+                except concurrent.futures.CancelledError as e:
+                    error = e
+                except Exception as e:
+                    log.error(f"failed to download {job.url} to {job.path}: {e}")
+                    error = e
+
+                if error is not None:
+                    failed.append(job)
+
+                if on_done:
+                    on_done(job, error)
+
+        return failed
@@ -0,0 +1,242 @@
+import re
+import html
+import shutil
+import sqlite3
+import hashlib
+import logging
+import pathlib
+import zipfile
+import threading
+import subprocess
+
+from . import paths
+from .moodle import Kind
+
+log = logging.getLogger("muddle.fulltext")
+
+
+def strip_html(text):
+    """ Returns the text of an HTML fragment, such as a summary """
+    text = re.sub(r"<(br|/p|/div|/li|/h\d)\b[^>]*>", "\n", text, flags=re.IGNORECASE)
+    text = html.unescape(re.sub(r"<[^>]*>", " ", text))
+    return re.sub(r"[ \t\r\f\v]+", " ", text).strip()
+
+
+def strip_xml(text):
+    """ Returns the text of the XML of an office document """
+    # paragraphs of docx / pptx / odt, words are split in runs inside them
+    text = re.sub(r"</(w:p|a:p|text:p|text:h)>", "\n", text)
+    return html.unescape(re.sub(r"<[^>]*>", "", text))
+
+
+def extract_pdf(path):
+    """ Uses pdftotext (poppler) or pypdf, whichever is available """
+    if shutil.which("pdftotext"):
+        result = subprocess.run(["pdftotext", "-q", "-enc", "UTF-8", str(path), "-"],
+                                capture_output=True, timeout=60)
+        return result.stdout.decode("utf-8", errors="replace")
+
+    try:
+        import pypdf
+    except ImportError:
+        log.debug("neither pdftotext nor pypdf is installed, pdfs are not indexed")
+        return None
+
+    reader = pypdf.PdfReader(str(path))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def extract_office(path, members):
+    with zipfile.ZipFile(path) as archive:
+        names = sorted(n for n in archive.namelist() if re.fullmatch(members, n))
+        return "\n".join(strip_xml(archive.read(n).decode("utf-8", errors="replace")) for n in names)
+
+
+extractors = {
+    ".pdf": extract_pdf,
+    ".html": lambda path: strip_html(path.read_text(errors="replace")),
+    ".htm": lambda path: strip_html(path.read_text(errors="replace")),
+    ".docx": lambda path: extract_office(path, r"word/document\.xml"),
+    ".pptx": lambda path: extract_office(path, r"ppt/slides/slide\d+\.xml"),
+    ".odt": lambda path: extract_office(path, r"content\.xml"),
+    ".odp": lambda path: extract_office(path, r"content\.xml"),
+}
+
+# read as they are
+text_suffixes = {".txt", ".md", ".csv", ".tex", ".py", ".c", ".h", ".cpp", ".java", ".m", ".rst"}
+
+
+def extract_text(path):
+    """ Returns the text of a file, or None if the type is not supported """
+    path = pathlib.Path(path)
+    suffix = path.suffix.lower()
+    try:
+        if suffix in text_suffixes:
+            return path.read_text(errors="replace")
+        if suffix in extractors:
+            return extractors[suffix](path)
+    except Exception as e:
+        log.warning(f"could not extract the text of {path}: {e}")
+
+    return None
+
+
+def key(kind, ident):
+    """ Key of an item in the index, files (contents) are identified by their url """
+    return f"{kind.value}:{ident}"
+
+
+class FullTextIndex:
+    """
+    SQLite FTS5 index of the course and section summaries, the module
+    descriptions and the text of the downloaded files
+
+    Every document has a key (see key()) to find the item it belongs to in
+    the tree. Documents are updated only if their text changed.
+    """
+
+    def __init__(self, path=None, max_file_size=20 * 1024 * 1024):
+        self.path = pathlib.Path(path or paths.default_cache_dir.joinpath("fulltext.sqlite3"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_file_size = max_file_size
+
+        # the connection is shared by the fetcher and download threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._db:
+            # the GUI and the CLI may use the index at the same time
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    key TEXT UNIQUE NOT NULL,
+                    kind TEXT NOT NULL,
+                    title TEXT,
+                    course TEXT,
+                    location TEXT,
+                    digest TEXT)""")
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5("
+                             "title, body, tokenize='unicode61 remove_diacritics 2')")
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates an index using the [fulltext] section of the config, returns
+        None if it is not enabled (or SQLite was built without FTS5)
+        """
+        if not config.getboolean("fulltext", "enabled", fallback=False):
+            return None
+
+        try:
+            return cls(path=config.get("fulltext", "path", fallback=None),
+                       max_file_size=config.getint("fulltext", "max_file_size", fallback=20) * 1024 * 1024)
+        except sqlite3.Error as e:
+            log.error(f"cannot open the full-text index: {e}")
+            return None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _add(self, key, kind, title, body, course=None, location=None):
+        # called with the lock held, inside a transaction
+        if not body or not body.strip():
+            self._remove(key)
+            return
+
+        digest = hashlib.sha1("\0".join([title, body, course or "", location or ""]).encode()).hexdigest()
+        row = self._db.execute("SELECT id, digest FROM documents WHERE key = ?", (key,)).fetchone()
+        if row and row[1] == digest:
+            return
+
+        if row:
+            self._db.execute("DELETE FROM documents_fts WHERE rowid = ?", (row[0],))
+            self._db.execute("UPDATE documents SET title = ?, course = ?, location = ?, digest = ? WHERE id = ?",
+                             (title, course, location, digest, row[0]))
+            rowid = row[0]
+        else:
+            rowid = self._db.execute(
+                "INSERT INTO documents (key, kind, title, course, location, digest) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind.value, title, course, location, digest)).lastrowid
+
+        self._db.execute("INSERT INTO documents_fts (rowid, title, body) VALUES (?, ?, ?)", (rowid, title, body))
+
+    def _remove(self, key):
+        row = self._db.execute("SELECT id FROM documents WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._db.execute("DELETE FROM documents_fts WHERE rowid = ?", (row[0],))
+            self._db.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+
+    def add_items(self, items):
+        """ Indexes the (Kind, dict) tuples yielded by MoodleInstance.walk """
+        with self._lock, self._db:
+            course = None
+            for kind, item in items:
+                if kind == Kind.COURSE:
+                    course = item.get("shortname")
+                    # lazily fetched courses do not carry the summary
+                    if "summary" not in item:
+                        continue
+                    self._add(key(kind, item["id"]), kind, item.get("fullname") or course,
+                              strip_html(item.get("summary") or ""), course)
+                elif kind == Kind.SECTION:
+                    self._add(key(kind, item["id"]), kind, item.get("name", ""),
+                              strip_html(item.get("summary") or ""), course)
+                elif kind == Kind.MODULE:
+                    self._add(key(kind, item["id"]), kind, item.get("name", ""),
+                              strip_html(item.get("description") or ""), course, item.get("url"))
+
+    def indexed(self, items):
+        """
+        Yields the items of MoodleInstance.walk unchanged, indexing them one
+        course at a time
+        """
+        batch = []
+        for kind, item in items:
+            if kind == Kind.COURSE and batch:
+                self.add_items(batch)
+                batch = []
+            batch.append((kind, item))
+            yield kind, item
+
+        self.add_items(batch)
+
+    def add_file(self, job, course=None):
+        """ Indexes the text of a downloaded file (a download.Download) """
+        try:
+            if job.path.stat().st_size > self.max_file_size:
+                return
+        except OSError:
+            return
+
+        text = extract_text(job.path)
+        if text is None:
+            return
+
+        with self._lock, self._db:
+            self._add(key(Kind.CONTENT, job.url), Kind.CONTENT, job.path.name, text, course, str(job.path))
+
+    @staticmethod
+    def query(text):
+        """ Converts what the user typed into an FTS5 query: all words, as prefixes """
+        return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+    def search(self, text, limit=50):
+        """
+        Returns the best matches for text as a list of dictionaries with the
+        keys key, kind, title, course, location and snippet
+        """
+        query = FullTextIndex.query(text)
+        if not query:
+            return []
+
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT d.key, d.kind, d.title, d.course, d.location,
+                       snippet(documents_fts, 1, '[', ']', '...', 12)
+                FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+                WHERE documents_fts MATCH ?
+                ORDER BY rank LIMIT ?""", (query, limit)).fetchall()
+
+        fields = ("key", "kind", "title", "course", "location", "snippet")
+        return [dict(zip(fields, row)) for row in rows]
@@ -7,37 +7,39 @@
 #   https://www.riverbankcomputing.com/static/Docs/PyQt6/index.html
 #
 import os
+import pathlib
 import platform
 import subprocess
 import sys
 import json
 import enum
+import hashlib
 import html
+import itertools
+import zlib
 import logging
-import tempfile
+import threading
+import time
 import code
 
 from http.cookiejar import Cookie
 
-from PyQt6 import uic
-
 from PyQt6.QtGui import (
     QFileSystemModel,
     QFont,
     QFontDatabase,
-    QIcon,
-    QStandardItem,
-    QStandardItemModel,
 )
 
 from PyQt6.QtCore import (
+    QAbstractItemModel,
+    QCoreApplication,
     QDir,
     QModelIndex,
     QObject,
-    QRegularExpression,
     QSignalBlocker,
     QSortFilterProxyModel,
     QThread,
+    QTimer,
     Qt,
     QUrl,
     pyqtSignal,
@@ -66,16 +68,36 @@ from PyQt6.QtWidgets import (
     QWidget,
 )
 
-from PyQt6.QtWebEngineCore import (QWebEnginePage, QWebEngineProfile)
-from PyQt6.QtWebEngineWidgets import QWebEngineView
-from PyQt6.QtNetwork import QNetworkCookie
+# QtWebEngine is slow to load and only needed by SwitchLoginDialog, it is
+# imported there
 
+from . import cache
+from . import catalog
+from . import download
+from . import fulltext
+from . import metrics
 from . import moodle
+from . import paths
+from . import search
+from . import sync
+from . import trace
+
+try:
+    # compiled from muddle.ui with: pyuic6 muddle/muddle.ui -o muddle/ui_muddle.py
+    from .ui_muddle import Ui_MuddleWindow
+except ImportError:
+    Ui_MuddleWindow = None
 
 
 log = logging.getLogger("muddle.gui")
 
-class MoodleItem(QStandardItem):
+class MoodleItem:
+    """
+    A node of the moodle tree. There can be tens of thousands of them, so
+    they are kept as small as possible: the Qt specific data (icons, flags)
+    is served by MoodleTreeModel from tables shared by all nodes of the same
+    type.
+    """
     class Type(enum.IntEnum):
         ROOT       = 0
         # root
@@ -97,91 +119,216 @@ class MoodleItem(QStandardItem):
         FILE       = 11
         URL        = 12
 
-    class Metadata:
-        def __init__(self, **kwargs):
-            for k, v in kwargs.items():
-                setattr(self, k, v)
+    __slots__ = ("type", "id", "title", "url", "size", "timemodified", "filepath", "parent", "row",
+                 "children", "checkState", "fetched", "pending", "timesynced")
 
-    def __init__(self, parent, nodetype, leaves=[], **kwargs):
-        super().__init__(parent)
-        self.metadata = MoodleItem.Metadata(type = nodetype, **kwargs)
-
-        # set icon
-        icons = {
-            MoodleItem.Type.COURSE   : QStyle.StandardPixmap.SP_DriveNetIcon,
-            MoodleItem.Type.FOLDER   : QStyle.StandardPixmap.SP_DirIcon,
-            MoodleItem.Type.RESOURCE : QStyle.StandardPixmap.SP_DirLinkIcon,
-            MoodleItem.Type.FILE     : QStyle.StandardPixmap.SP_FileIcon,
-            MoodleItem.Type.URL      : QStyle.StandardPixmap.SP_FileLinkIcon,
-        }
-
-        if self.metadata.type in icons.keys():
-            self.setIcon(QApplication.style().standardIcon(icons[self.metadata.type]))
-        else:
-            # remove icon, because otherwise it inherits the parent's icon
-            self.setIcon(QIcon())
+    def __init__(self, nodetype, id=None, title="", url=None, size=None, timemodified=None, filepath=None):
+        self.type = nodetype
+        self.id = id
+        self.title = html.unescape(title)
+        self.url = url
+        self.size = size
+        self.timemodified = timemodified
+        # used only by files, their directory in a folder module
+        self.filepath = filepath
+
+        self.parent = None
+        self.row = 0
+        # shared empty tuple until the first child is added
+        self.children = ()
+
+        self.checkState = Qt.CheckState.Unchecked
+        # used only by courses in lazy mode, see MoodleTreeModel.fetchMore
+        self.fetched = True
+        self.pending = False
+        # used only by courses, time of the last (incremental) refresh
+        self.timesynced = None
 
-        if self.metadata.type in [ MoodleItem.Type.FILE, MoodleItem.Type.FOLDER, MoodleItem.Type.RESOURCE ]:
-            # NOTE: because of a Qt Bug setAutoTristate does not work
-            # the tri-state behavior is implemented below in
-            # MuddleWindow.onMoodleTreeModelDataChanged()
-            self.setCheckable(True)
-            self.setCheckState(Qt.CheckState.Unchecked)
+    def appendChild(self, child):
+        if not self.children:
+            self.children = []
 
-        self.setEditable(False)
-        self.setText(html.unescape(self.metadata.title))
+        child.parent = self
+        child.row = len(self.children)
+        self.children.append(child)
 
 
 class MoodleFetcher(QThread):
+    # the items are moodle.SchemaObj objects
     loadedItem = pyqtSignal(MoodleItem.Type, object)
-
-    def __init__(self, parent, instanceUrl, token):
+    # list of (MoodleItem.Type, object) tuples, the subtree of a course
+    loadedBatch = pyqtSignal(list)
+
+    # of the items yielded by MoodleInstance.walk
+    itemTypes = {
+        moodle.Kind.COURSE  : MoodleItem.Type.COURSE,
+        moodle.Kind.SECTION : MoodleItem.Type.SECTION,
+        moodle.Kind.MODULE  : MoodleItem.Type.MODULE,
+        moodle.Kind.CONTENT : MoodleItem.Type.CONTENT,
+    }
+
+    def __init__(self, parent, instance, courses=None, maxWorkers=4, batched=False, lazy=False, since=None,
+                 fulltext=None):
+        """
+        Fetches the tree of the given courses, or of all enrolled courses if
+        courses is None. In lazy mode only the list of courses is fetched,
+        without their contents. since is passed to MoodleInstance.walk to
+        fetch only what changed in some courses. If fulltext is given the
+        summaries and descriptions are added to it.
+        """
         super().__init__()
 
-        self.api = moodle.RestApi(instanceUrl, token)
+        self.instance = instance
+        self.api = self.instance.api
         self.apihelper = moodle.ApiHelper(self.api)
+        self.courses = courses
+        self.maxWorkers = maxWorkers
+        self.batched = batched
+        self.lazy = lazy
+        self.since = since
+        self.fulltext = fulltext
 
     def run(self):
-        for course in self.getCourses():
-            self.loadedItem.emit(MoodleItem.Type.COURSE, course)
-            for section in self.getSections(course):
-                self.loadedItem.emit(MoodleItem.Type.SECTION, section)
-                for module in self.getModules(section):
-                    self.loadedItem.emit(MoodleItem.Type.MODULE, module)
-                    for content in self.getContent(module):
-                        self.loadedItem.emit(MoodleItem.Type.CONTENT, content)
+        trace.thread_name("MoodleFetcher")
+        with trace.span("MoodleFetcher.run", lazy=self.lazy):
+            self.fetch()
+
+    def fetch(self):
+        courses = self.courses if self.courses is not None else self.getCourses()
+
+        if self.lazy:
+            if self.fulltext:
+                self.fulltext.add_items((moodle.Kind.COURSE, c) for c in courses)
+            courses = [moodle.Course._fromdict(c) for c in courses]
+            if self.batched:
+                self.loadedBatch.emit([(MoodleItem.Type.COURSE, c) for c in courses])
+            else:
+                for course in courses:
+                    self.loadedItem.emit(MoodleItem.Type.COURSE, course)
+            return
+
+        items = self.instance.walk(courses, self.maxWorkers, self.since)
+        if self.fulltext:
+            items = self.fulltext.indexed(items)
+        items = moodle.typed(items)
+
+        batch = []
+        for kind, item in items:
+            if not self.batched:
+                self.loadedItem.emit(MoodleFetcher.itemTypes[kind], item)
+                continue
+
+            if kind == moodle.Kind.COURSE and batch:
+                self.loadedBatch.emit(batch)
+                batch = []
+
+            batch.append((MoodleFetcher.itemTypes[kind], item))
+
+        if batch:
+            self.loadedBatch.emit(batch)
 
     def getCourses(self):
-        coursesReq = self.api.core_enrol_get_users_courses(userid = self.apihelper.get_userid())
-        if not coursesReq:
-            return []
+        return self.instance.get_user_courses() or []
 
-        return coursesReq.json()
 
-    def getSections(self, course):
-        if not "id" in course:
-            log.error("cannot get sections from invalid course (no id)")
-            log.debug(course)
-            return []
+class MoodleDownloader(QThread):
+    # files done, total files, KiB done, total KiB
+    progress = pyqtSignal(int, int, int, int)
+    # number of files that failed
+    done = pyqtSignal(int)
 
-        sectionsReq = self.api.core_course_get_contents(courseid = str(course["id"]))
-        if not sectionsReq:
-            return []
+    def __init__(self, parent, downloader, jobs, manifest=None, fulltext=None):
+        super().__init__()
 
-        sections = sectionsReq.json()
-        return sections
+        self.downloader = downloader
+        self.jobs = jobs
+        self.manifest = manifest
+        self.fulltext = fulltext
 
-    def getModules(self, section):
-        if "modules" in section:
-            return section["modules"]
-        else:
-            return []
+        self.lock = threading.Lock()
+        self.filesDone = 0
+        self.bytesDone = 0
+        self.totalBytes = sum(job.size or 0 for job in jobs)
+        self.lastEmit = 0
 
-    def getContent(self, module):
-        if "contents" in module:
-            return module["contents"]
-        else:
-            return []
+    def run(self):
+        trace.thread_name("MoodleDownloader")
+        try:
+            failed = self.downloader.download(self.jobs, self.onBytes, self.onDone)
+        finally:
+            if self.manifest:
+                self.manifest.save()
+        self.emitProgress(force = True)
+        self.done.emit(len(failed))
+
+    def onBytes(self, job, n):
+        with self.lock:
+            self.bytesDone += n
+        self.emitProgress()
+
+    def onDone(self, job, error):
+        if error is None and self.manifest:
+            self.manifest.record(job)
+        if error is None and self.fulltext:
+            self.fulltext.add_file(job)
+
+        with self.lock:
+            self.filesDone += 1
+        self.emitProgress(force = True)
+
+    def emitProgress(self, force = False):
+        # called from many threads, do not flood the GUI thread with signals
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.lastEmit < 0.1:
+                return
+            self.lastEmit = now
+            filesDone, bytesDone = self.filesDone, self.bytesDone
+
+        self.progress.emit(filesDone, len(self.jobs), bytesDone // 1024, self.totalBytes // 1024)
+
+
+class MoodleFileOpener(QThread):
+    """ Downloads a file of the tree into the preview cache, to open it """
+    # item, percent done
+    progress = pyqtSignal(object, int)
+    # item, path of the file or None if the download failed
+    done = pyqtSignal(object, object)
+
+    def __init__(self, parent, apihelper, previews, item):
+        super().__init__()
+
+        self.apihelper = apihelper
+        self.previews = previews
+        self.item = item
+        self.bytesDone = 0
+        self.lastPercent = -1
+
+    def run(self):
+        trace.thread_name("MoodleFileOpener")
+        item = self.item
+        path = self.previews.path(item.url, item.timemodified, item.title)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.apihelper.get_file(item.url, path, self.onBytes, filesize=item.size, timemodified=item.timemodified)
+        except Exception as e:
+            log.error(f"failed to download {item.url}: {e}")
+            self.done.emit(item, None)
+            return
+
+        self.previews.evict(keep=path)
+        self.done.emit(item, self.previews.get(item.url, item.timemodified, item.title))
+
+    def onBytes(self, n):
+        self.bytesDone += n
+        if not self.item.size:
+            return
+
+        # emit only when the displayed value changes
+        percent = min(100, self.bytesDone * 100 // self.item.size)
+        if percent != self.lastPercent:
+            self.lastPercent = percent
+            self.progress.emit(self.item, percent)
 
 
 class SwitchLoginDialog(QDialog):
@@ -189,6 +336,9 @@ class SwitchLoginDialog(QDialog):
         super().__init__(parent)
         self.setWindowTitle("SWICH AAI Login")
 
+        from PyQt6.QtWebEngineCore import QWebEnginePage, QWebEngineProfile
+        from PyQt6.QtWebEngineWidgets import QWebEngineView
+
         self.webview = QWebEngineView(self)
         self.profile = QWebEngineProfile(self.webview)
         self.cookies = []
@@ -204,8 +354,10 @@ class SwitchLoginDialog(QDialog):
         self.setLayout(layout)
         self.setMinimumSize(800, 600)
 
-    @pyqtSlot(QNetworkCookie)
+    # not decorated with pyqtSlot, that would need QtNetwork at import time
     def onCookieAdded(self, cookie):
+        from PyQt6.QtNetwork import QNetworkCookie
+
         for c in self.cookies:
             if c.hasSameIdentifier(cookie):
                 return
@@ -221,58 +373,502 @@ class SwitchLoginDialog(QDialog):
 class MoodleTreeFilterModel(QSortFilterProxyModel):
     def __init__(self):
         super().__init__()
+        # items found by the search, None to show every item
+        self.matches = None
+
+    @trace.traced("proxy filter")
+    def setMatches(self, matches):
+        self.matches = matches
+        # invalidateFilter() updates the mapping of every row that is
+        # expanded in the view one by one, which is much slower than
+        # rebuilding it (the view is expanded or collapsed afterwards anyway)
+        self.invalidate()
+
+    def filterAcceptsRow(self, sourceRow, sourceParent):
+        if self.matches is None:
+            return True
+
+        parent = sourceParent.internalPointer() if sourceParent.isValid() else self.sourceModel().root
+        return parent.children[sourceRow] in self.matches
+
+    # Sorting and filtering on every inserted row is expensive, these are
+    # used to do it only once after a batch of rows has been inserted
+    @pyqtSlot()
+    def suspendDynamicSortFilter(self):
+        self.setDynamicSortFilter(False)
 
-
-class MoodleTreeModel(QStandardItemModel):
-    def __init__(self):
+    @pyqtSlot()
+    @trace.traced("proxy resort")
+    def resumeDynamicSortFilter(self):
+        # re-enabling sorts and filters the whole model again
+        self.setDynamicSortFilter(True)
+
+
+class MoodleTreeModel(QAbstractItemModel):
+    batchAboutToBeInserted = pyqtSignal()
+    batchInserted = pyqtSignal()
+    # emitted by setCheckState in place of dataChanged for the descendants
+    # of an item, when they are under too many parents, views should repaint
+    checkStatesChanged = pyqtSignal()
+
+    headers = ["Item", "Size"]
+
+    # NOTE: because of a Qt Bug setAutoTristate does not work, the tri-state
+    # behavior of these is implemented in setData()
+    checkableTypes = frozenset([
+        MoodleItem.Type.COURSE,
+        MoodleItem.Type.SECTION,
+        MoodleItem.Type.FILE,
+        MoodleItem.Type.FOLDER,
+        MoodleItem.Type.RESOURCE,
+    ])
+
+    # table of icons shared by all items, see icon()
+    iconPixmaps = {
+        MoodleItem.Type.COURSE   : QStyle.StandardPixmap.SP_DriveNetIcon,
+        MoodleItem.Type.FOLDER   : QStyle.StandardPixmap.SP_DirIcon,
+        MoodleItem.Type.RESOURCE : QStyle.StandardPixmap.SP_DirLinkIcon,
+        MoodleItem.Type.FILE     : QStyle.StandardPixmap.SP_FileIcon,
+        MoodleItem.Type.URL      : QStyle.StandardPixmap.SP_FileLinkIcon,
+    }
+    icons = {}
+
+    # see setCheckState
+    maxCheckSignals = 32
+
+    # increase when the format of the snapshot changes
+    snapshotVersion = 6
+
+    def __init__(self, pool=None, cache=None, maxWorkers=4, lazy=False, prefetch=3, incremental=False,
+                 fulltext=None, catalog=None, fullRefreshEvery=10, batched=True):
         super().__init__()
 
-        self.setHorizontalHeaderLabels(["Item", "Size"])
+        self.root = MoodleItem(MoodleItem.Type.ROOT)
         self.lastInsertedItem = None
         self.worker = None
+        self.pool = pool or moodle.HttpPool()
+        self.cache = cache
+        self.fulltext = fulltext
+        self.catalog = catalog
+        self.maxWorkers = maxWorkers
+        # insert the items a course at a time (see insertPendingBatches)
+        # instead of one by one as they arrive, which is much faster but
+        # shows nothing until the first course is complete
+        self.batched = batched
+
+        # in lazy mode only the courses are fetched on refresh, their
+        # contents are fetched when they are expanded (see fetchMore)
+        self.lazy = lazy
+        self.prefetch = prefetch
+        self.instance = None
+        self.instanceUrl = None
+        self.courseItems = {}
+        self.seenCourses = set()
+        self.contentWorkers = []
+        # content workers whose results are not wanted anymore, kept until
+        # they finish (a QThread must not be destroyed while it runs)
+        self.retiredWorkers = []
+
+        # on refresh ask only for the modules that changed since the last
+        # refresh of each course, see MoodleInstance.walk
+        self.incremental = incremental
+        # incremental refreshes do not notice deleted or moved modules, after
+        # this many of them the next refresh is a full one (0 for never)
+        self.fullRefreshEvery = fullRefreshEvery
+        self.incrementalRefreshes = 0
+
+        # search index of the titles of all items in the tree
+        self.titleIndex = search.TitleIndex()
+
+        # items that are being downloaded to be opened, with their progress
+        self.itemProgress = {}
+
+        # batches that arrive in quick succession are inserted together
+        self.pendingBatches = []
+        self.batchTimer = QTimer(self)
+        self.batchTimer.setSingleShot(True)
+        self.batchTimer.setInterval(50)
+        self.batchTimer.timeout.connect(self.insertPendingBatches)
+
+    @classmethod
+    def icon(cls, type):
+        # the icons can only be created once there is a QApplication
+        if type not in cls.icons:
+            pixmap = cls.iconPixmaps.get(type)
+            cls.icons[type] = QApplication.style().standardIcon(pixmap) if pixmap else None
+
+        return cls.icons[type]
+
+    @staticmethod
+    def formatSize(size):
+        for unit in ["B", "KiB", "MiB", "GiB"]:
+            if size < 1024 or unit == "GiB":
+                break
+            size /= 1024
+
+        return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+    def itemFromIndex(self, index):
+        if not index.isValid():
+            return None
+
+        return index.internalPointer()
+
+    def indexFromItem(self, item, column=0):
+        if item is None or item is self.root:
+            return QModelIndex()
+
+        return self.createIndex(item.row, column, item)
+
+    # NOTE: index() and data() are called a lot by views and proxies (when
+    # sorting and filtering), so they avoid calling other python methods
+    def index(self, row, column, parent=QModelIndex()):
+        parentItem = parent.internalPointer() if parent.isValid() else self.root
+        if row < 0 or row >= len(parentItem.children) or column < 0 or column > 1:
+            return QModelIndex()
+
+        return self.createIndex(row, column, parentItem.children[row])
+
+    def parent(self, index=None):
+        # QObject.parent() has the same name
+        if index is None:
+            return super().parent()
+
+        item = self.itemFromIndex(index)
+        if item is None:
+            return QModelIndex()
+
+        return self.indexFromItem(item.parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+
+        item = self.itemFromIndex(parent) or self.root
+        return len(item.children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.headers[section]
+
+        return None
+
+    def flags(self, index):
+        item = self.itemFromIndex(index)
+        if item is None:
+            return Qt.ItemFlag.NoItemFlags
+
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() == 0 and item.type in self.checkableTypes:
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+
+        return flags
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        item = index.internalPointer()
+        if index.column() == 1:
+            if role == Qt.ItemDataRole.DisplayRole:
+                if item in self.itemProgress:
+                    return f"{self.itemProgress[item]}%"
+                if item.size is not None:
+                    return self.formatSize(item.size)
+            return None
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return item.title
+        elif role == Qt.ItemDataRole.DecorationRole:
+            return self.icon(item.type)
+        elif role == Qt.ItemDataRole.CheckStateRole and item.type in self.checkableTypes:
+            return item.checkState
+
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        item = self.itemFromIndex(index)
+        if item is None or role != Qt.ItemDataRole.CheckStateRole or item.type not in self.checkableTypes:
+            return False
+
+        self.setCheckState(item, Qt.CheckState(value))
+        return True
+
+    def setCheckState(self, item, state):
+        """
+        Sets the check state of item and of its checkable descendants (also
+        those under items that are not checkable, e.g. the files of an
+        assignment), and updates the (tri-)state of its checkable ancestors
+
+        The items are updated first, then one dataChanged is emitted for the
+        range of rows that changed under each parent, instead of one signal
+        per item (checking a course would repaint once per file otherwise).
+        If the descendants that changed are under more than maxCheckSignals
+        parents, checkStatesChanged is emitted instead of their signals:
+        each one goes through the proxy and the view, which takes hundreds
+        of milliseconds for a large course, while the check state does not
+        affect sorting and filtering and the view only needs a repaint.
+        """
+        # parent -> [first, last] row that changed
+        changed = {}
+
+        def mark(item):
+            rows = changed.get(item.parent)
+            if rows is None:
+                changed[item.parent] = [item.row, item.row]
+            else:
+                rows[0] = min(rows[0], item.row)
+                rows[1] = max(rows[1], item.row)
+
+        # this is here to emulate the behavior of setAutoTristate which does not
+        # work because of a Qt Bug, see https://bugreports.qt.io/browse/QTBUG-59173
+        stack = [item]
+        while stack:
+            current = stack.pop()
+            if current.checkState != state and current.type in self.checkableTypes:
+                current.checkState = state
+                mark(current)
+            # in reverse so that the items (and the signals) are in the order of the tree
+            stack.extend(reversed(current.children))
+
+        coalesced = len(changed) > self.maxCheckSignals
+        if coalesced:
+            changed = {}
+            mark(item)
+
+        for parent in self.updateCheckStates(item.parent):
+            mark(parent)
+
+        for parent, (first, last) in changed.items():
+            self.dataChanged.emit(self.createIndex(first, 0, parent.children[first]),
+                                  self.createIndex(last, 0, parent.children[last]),
+                                  [Qt.ItemDataRole.CheckStateRole])
+
+        if coalesced:
+            self.checkStatesChanged.emit()
+
+    def updateCheckStates(self, item):
+        """
+        Updates the (tri-)state of item and of its ancestors from their
+        children, stopping at the first that does not change, and yields
+        those that changed
+        """
+        while item is not None and item is not self.root:
+            if item.type in self.checkableTypes:
+                state = self.childrenCheckState(item)
+                if state == item.checkState:
+                    return
+
+                item.checkState = state
+                yield item
+            item = item.parent
+
+    def childrenCheckState(self, item):
+        """
+        Checked or Unchecked if all checkable descendants are, PartiallyChecked
+        otherwise. The state of a checkable child already stands for its
+        descendants, only the children of the others are looked at.
+        """
+        states = set()
+        stack = list(item.children)
+        while stack and len(states) < 2:
+            child = stack.pop()
+            if child.type in self.checkableTypes:
+                states.add(child.checkState)
+            else:
+                stack.extend(child.children)
+
+        if len(states) == 1:
+            return states.pop()
+
+        return Qt.CheckState.PartiallyChecked if states else item.checkState
+
+    def emitCheckStatesChanged(self, items):
+        for item in items:
+            index = self.indexFromItem(item)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.CheckStateRole])
+
+    def setItemProgress(self, item, percent):
+        """ Shows the progress of a download in place of the size, None to remove it """
+        if percent is None:
+            self.itemProgress.pop(item, None)
+        else:
+            self.itemProgress[item] = percent
+
+        index = self.indexFromItem(item, 1)
+        if index.isValid():
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
+
+    def appendItems(self, parent, items):
+        """ Attaches the given (detached) items as children of parent """
+        if not items:
+            return
+
+        self.indexItems(items)
+
+        # the items take the state of their closest checkable ancestor, e.g.
+        # the sections of a course that was checked before it was loaded
+        ancestor = parent
+        while ancestor is not None and ancestor.type not in self.checkableTypes:
+            ancestor = ancestor.parent
+        inherit = ancestor is not None and ancestor.checkState != Qt.CheckState.PartiallyChecked
+        if inherit:
+            stack = list(items)
+            while stack:
+                item = stack.pop()
+                if item.type in self.checkableTypes:
+                    item.checkState = ancestor.checkState
+                stack.extend(item.children)
+
+        first = len(parent.children)
+        self.beginInsertRows(self.indexFromItem(parent), first, first + len(items) - 1)
+        for item in items:
+            parent.appendChild(item)
+        self.endInsertRows()
+
+        # otherwise its state depends on what the items are
+        if ancestor is not None and not inherit:
+            self.emitCheckStatesChanged(self.updateCheckStates(parent))
+
+    def clear(self):
+        self.batchTimer.stop()
+        self.pendingBatches = []
+
+        self.beginResetModel()
+        self.root = MoodleItem(MoodleItem.Type.ROOT)
+        self.lastInsertedItem = None
+        self.courseItems = {}
+        self.titleIndex.clear()
+        self.endResetModel()
+
+    def indexItems(self, items):
+        """ Adds items and all their descendants to the search index """
+        stack = list(items)
+        while stack:
+            item = stack.pop()
+            self.titleIndex.add(item, item.title)
+            stack.extend(item.children)
+
+    def unindexItems(self, items):
+        """ Removes items and all their descendants from the search index """
+        stack = list(items)
+        while stack:
+            item = stack.pop()
+            self.titleIndex.remove(item)
+            stack.extend(item.children)
 
     @pyqtSlot(str, str)
     def refresh(self, instanceUrl, token):
         if not self.worker or self.worker.isFinished():
-            self.setRowCount(0) # instead of clear(), because clear() removes the headers
-
-            self.worker = MoodleFetcher(self, instanceUrl, token)
+            # batches are merged into the tree that is already there (for
+            # example loaded from a snapshot), single items are not
+            if not self.batched or instanceUrl != self.instanceUrl:
+                self.clear()
+
+            # results of old lazy fetches are not wanted anymore
+            for worker in self.contentWorkers:
+                worker.loadedBatch.disconnect(self.onWorkerLoadedBatch)
+            self.retiredWorkers += [w for w in self.contentWorkers if not w.isFinished()]
+            self.contentWorkers = []
+            # so that they can be fetched again
+            for course in self.courseItems.values():
+                course.pending = False
+
+            self.instanceUrl = instanceUrl
+            self.seenCourses = set()
+
+            since = None
+            if self.incremental and self.batched:
+                if self.fullRefreshEvery and self.incrementalRefreshes >= self.fullRefreshEvery:
+                    log.debug("full refresh to remove the modules that were deleted or moved")
+                    self.incrementalRefreshes = 0
+                else:
+                    since = {course.id: course.timesynced for course in self.courseItems.values()
+                             if course.fetched and course.timesynced}
+                    self.incrementalRefreshes += 1
+
+            self.instance = moodle.MoodleInstance(instanceUrl, token, self.pool, self.cache, catalog = self.catalog)
+            self.worker = MoodleFetcher(self, self.instance, None, self.maxWorkers, self.batched, self.lazy, since,
+                                        self.fulltext)
             self.worker.loadedItem.connect(self.onWorkerLoadedItem)
+            if self.lazy:
+                self.worker.loadedBatch.connect(self.onWorkerLoadedCourseList)
+            else:
+                self.worker.loadedBatch.connect(self.onWorkerLoadedBatch)
             self.worker.finished.connect(self.onWorkerDone)
             self.worker.start()
         else:
             log.debug("A worker is already running, not refreshing")
 
-    @pyqtSlot(MoodleItem.Type, object)
-    def onWorkerLoadedItem(self, type, item):
-        # Assume that the items arrive in order
-        moodleItem = None
-        parent = None
+    def hasChildren(self, parent=QModelIndex()):
+        item = self.itemFromIndex(parent) or self.root
+        # show the expand arrow on courses whose contents are not loaded yet
+        return bool(item.children) or not item.fetched
 
-        # if top level
-        if type == MoodleItem.Type.COURSE:
-            moodleItem = MoodleItem(
-                parent = parent,
-                nodetype = type,
-                id = item["id"],
-                title = item["shortname"])
+    def canFetchMore(self, parent):
+        item = self.itemFromIndex(parent)
+        if not item or not self.instance:
+            return False
 
-            self.invisibleRootItem().insertRow(0, moodleItem)
-            self.lastInsertedItem = moodleItem
+        return not item.fetched and not item.pending
 
+    def fetchMore(self, parent):
+        item = self.itemFromIndex(parent)
+        if not item or not self.canFetchMore(parent):
             return
 
-        # otherwise
-        parent = self.lastInsertedItem
-        while type <= parent.metadata.type and parent.parent():
-            parent = parent.parent()
+        self.rememberCourse(item.id)
+        self.fetchCourses([item])
 
-        if type == MoodleItem.Type.SECTION:
-            moodleItem = MoodleItem(
-                parent = parent,
-                nodetype = type,
-                id = item["id"],
-                title = item["name"])
+    def fetchCourses(self, items):
+        """ Fetches the contents of courses that were loaded lazily """
+        for item in items:
+            item.pending = True
+
+        courses = [{"id": item.id, "shortname": item.title} for item in items]
+        worker = MoodleFetcher(self, self.instance, courses, self.maxWorkers, batched=True,
+                               fulltext=self.fulltext)
+        worker.loadedBatch.connect(self.onWorkerLoadedBatch)
+        worker.finished.connect(self.onContentWorkerDone)
+        self.contentWorkers.append(worker)
+        worker.start()
+
+    @pyqtSlot()
+    def onContentWorkerDone(self):
+        self.insertPendingBatches()
+        self.contentWorkers = [w for w in self.contentWorkers if not w.isFinished()]
+        self.retiredWorkers = [w for w in self.retiredWorkers if not w.isFinished()]
+        self.saveSnapshot()
+
+    @staticmethod
+    def recentCourses():
+        try:
+            with open(paths.default_cache_dir.joinpath("recent_courses.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def rememberCourse(self, courseId):
+        """ Keeps track of recently opened courses, to prefetch them """
+        recent = [courseId] + [c for c in self.recentCourses() if c != courseId]
+        try:
+            paths.default_cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(paths.default_cache_dir.joinpath("recent_courses.json"), "w") as f:
+                json.dump(recent[:self.prefetch], f)
+        except OSError as e:
+            log.warning(f"could not save recently used courses: {e}")
+
+    @staticmethod
+    def makeItem(type, item):
+        """ Creates a (detached) MoodleItem from a moodle.SchemaObj """
+        if type == MoodleItem.Type.COURSE:
+            return MoodleItem(type, id = item.id, title = item.shortname)
+
+        elif type == MoodleItem.Type.SECTION:
+            return MoodleItem(type, id = item.id, title = item.name)
 
         elif type == MoodleItem.Type.MODULE:
             moduleType = {
@@ -284,11 +880,10 @@ class MoodleTreeModel(QStandardItemModel):
                 "quiz"       : MoodleItem.Type.QUIZ,
             }
 
-            moodleItem = MoodleItem(
-                parent = parent,
-                nodetype = moduleType.get(item["modname"]) or type,
-                id = item["id"],
-                title = item["name"])
+            return MoodleItem(
+                moduleType.get(item.modname) or type,
+                id = item.id,
+                title = item.name)
 
         elif type == MoodleItem.Type.CONTENT:
             contentType = {
@@ -296,22 +891,365 @@ class MoodleTreeModel(QStandardItemModel):
                 "file" : MoodleItem.Type.FILE,
             }
 
-            moodleItem = MoodleItem(
-                parent = parent,
-                nodetype = contentType.get(item["type"]) or type,
-                title = item["filename"],
-                url = item["fileurl"])
+            return MoodleItem(
+                contentType.get(item.type) or type,
+                title = item.filename,
+                url = item.fileurl,
+                size = item.filesize,
+                timemodified = item.timemodified,
+                filepath = getattr(item, "filepath", None))
+
+        return None
 
+    @pyqtSlot(MoodleItem.Type, object)
+    @trace.traced()
+    def onWorkerLoadedItem(self, type, item):
+        # Assume that the items arrive in order
+        moodleItem = MoodleTreeModel.makeItem(type, item)
         if not moodleItem:
             log.error(f"Could not load item of type {type}")
             return
 
-        parent.insertRow(0, moodleItem)
+        # if top level
+        if type == MoodleItem.Type.COURSE:
+            moodleItem.fetched = not self.lazy
+            self.courseItems[item.id] = moodleItem
+            self.appendItems(self.root, [moodleItem])
+            self.lastInsertedItem = moodleItem
+            return
+
+        # otherwise
+        parent = self.lastInsertedItem
+        while type <= parent.type and parent.parent is not self.root:
+            parent = parent.parent
+
+        self.appendItems(parent, [moodleItem])
         self.lastInsertedItem = moodleItem
 
+    @pyqtSlot(list)
+    def onWorkerLoadedBatch(self, batch):
+        self.pendingBatches.append(batch)
+        if not self.batchTimer.isActive():
+            self.batchTimer.start()
+
+    @pyqtSlot()
+    @trace.traced()
+    def insertPendingBatches(self):
+        # Same as onWorkerLoadedItem, but the whole subtree is built before
+        # being attached to the model, so that the views and proxies are
+        # notified only once per batch instead of once per item
+        if not self.pendingBatches:
+            return
+
+        start = time.perf_counter()
+        batches, self.pendingBatches = self.pendingBatches, []
+        self.batchAboutToBeInserted.emit()
+
+        courses = []
+        # path from the course to the last inserted item
+        stack = []
+        for type, item in itertools.chain.from_iterable(batches):
+            moodleItem = MoodleTreeModel.makeItem(type, item)
+            if not moodleItem:
+                log.error(f"Could not load item of type {type}")
+                continue
+
+            if type == MoodleItem.Type.COURSE:
+                moodleItem.timesynced = item.timesynced
+                # if the course could not be fetched keep what is there
+                partial = item.incremental or not moodleItem.timesynced
+                courses.append((moodleItem, partial))
+                stack = [moodleItem]
+                continue
+
+            while len(stack) > 1 and type <= stack[-1].type:
+                stack.pop()
+
+            stack[-1].appendChild(moodleItem)
+            stack.append(moodleItem)
+
+        newCourses = []
+        for course, partial in courses:
+            self.seenCourses.add(course.id)
+            existing = self.courseItems.get(course.id)
+            if existing:
+                # update the contents of a course that was already loaded
+                # (from a snapshot, lazily or incrementally)
+                self.mergeItem(existing, course, partial)
+                existing.fetched = True
+                existing.pending = False
+                existing.timesynced = course.timesynced or existing.timesynced
+            else:
+                self.courseItems[course.id] = course
+                newCourses.append(course)
+
+        self.appendItems(self.root, newCourses)
+        self.batchInserted.emit()
+        metrics.registry.record_stage("insert", time.perf_counter() - start)
+
+    @pyqtSlot(list)
+    def onWorkerLoadedCourseList(self, batch):
+        # In lazy mode only the courses are fetched, if a course is already
+        # present its contents are kept but refetched when it is expanded
+        newCourses = []
+        for type, item in batch:
+            course = MoodleTreeModel.makeItem(type, item)
+            self.seenCourses.add(course.id)
+
+            existing = self.courseItems.get(course.id)
+            if existing:
+                self.updateItem(existing, course)
+                existing.fetched = False
+                existing.pending = False
+            else:
+                course.fetched = False
+                self.courseItems[course.id] = course
+                newCourses.append(course)
+
+        self.appendItems(self.root, newCourses)
+
+    @staticmethod
+    def itemKey(item):
+        # contents do not have an id
+        return (item.type, item.id if item.id is not None else item.url)
+
+    def updateItem(self, item, new):
+        """ Copies the data of new into item """
+        if (item.title, item.url, item.size) != (new.title, new.url, new.size):
+            if item.title != new.title:
+                self.titleIndex.add(item, new.title)
+            item.title, item.url, item.size = new.title, new.url, new.size
+            self.dataChanged.emit(self.indexFromItem(item, 0), self.indexFromItem(item, 1))
+        # not shown, no signal needed
+        item.timemodified = new.timemodified
+        item.filepath = new.filepath
+
+    def mergeItem(self, item, new, partial=False):
+        """
+        Updates item (which is in the model) and its children to match the
+        detached item new, emitting only the signals for what changed. If
+        partial is true, new contains only the modules that changed, so
+        sections and modules that are not in new are kept.
+        """
+        self.updateItem(item, new)
+
+        if not partial or item.type not in [MoodleItem.Type.COURSE, MoodleItem.Type.SECTION]:
+            newKeys = set(MoodleTreeModel.itemKey(c) for c in new.children)
+            self.removeItems(item, [c for c in item.children if MoodleTreeModel.itemKey(c) not in newKeys])
+
+        children = {MoodleTreeModel.itemKey(c): c for c in item.children}
+        added = []
+        for child in new.children:
+            existing = children.get(MoodleTreeModel.itemKey(child))
+            if existing:
+                self.mergeItem(existing, child, partial)
+            else:
+                added.append(child)
+
+        self.appendItems(item, added)
+
+    def removeItems(self, parent, items):
+        """ Removes the given children of parent """
+        if not items:
+            return
+
+        rows = sorted(item.row for item in items)
+        # remove contiguous ranges starting from the bottom, so that the
+        # rows above are not affected
+        while rows:
+            last = rows.pop()
+            first = last
+            while rows and rows[-1] == first - 1:
+                first = rows.pop()
+
+            self.beginRemoveRows(self.indexFromItem(parent), first, last)
+            self.unindexItems(parent.children[first:last + 1])
+            for item in parent.children[first:last + 1]:
+                if item.type == MoodleItem.Type.COURSE:
+                    self.courseItems.pop(item.id, None)
+            del parent.children[first:last + 1]
+            for row in range(first, len(parent.children)):
+                parent.children[row].row = row
+            self.endRemoveRows()
+
+        # e.g. the only unchecked file of a section was removed
+        self.emitCheckStatesChanged(self.updateCheckStates(parent))
+
+    def itemsForKeys(self, keys):
+        """ Returns the set of items with the given keys of the full-text index """
+        if not keys:
+            return set()
+
+        found = set()
+        stack = list(self.root.children)
+        while stack:
+            item = stack.pop()
+            if item.type == MoodleItem.Type.COURSE:
+                kind = moodle.Kind.COURSE
+            elif item.type == MoodleItem.Type.SECTION:
+                kind = moodle.Kind.SECTION
+            elif item.type < MoodleItem.Type.CONTENT:
+                kind = moodle.Kind.MODULE
+            else:
+                kind = moodle.Kind.CONTENT
+
+            if fulltext.key(kind, item.url if kind == moodle.Kind.CONTENT else item.id) in keys:
+                found.add(item)
+            stack.extend(item.children)
+
+        return found
+
+    def checkedFiles(self):
+        """
+        Yields tuples (item, titles) for every checked file, where titles is
+        the list of the titles of the items from the course to the file,
+        with the directories of the files of folders before the file
+        """
+        stack = [(child, [child.title]) for child in reversed(self.root.children)]
+        while stack:
+            item, titles = stack.pop()
+            if item.type == MoodleItem.Type.FILE and item.checkState == Qt.CheckState.Checked:
+                yield item, titles[:-1] + download.filepath_parts(item.filepath) + titles[-1:]
+
+            stack.extend((child, titles + [child.title]) for child in reversed(item.children))
+
+    def snapshotPath(self):
+        key = hashlib.sha1(self.instanceUrl.encode()).hexdigest()[:16]
+        return paths.default_cache_dir.joinpath("snapshots", f"{key}.bin")
+
+    def saveSnapshot(self):
+        """
+        Writes the tree into a compressed JSON file, which is loaded at the
+        next start with loadSnapshot
+        """
+        if not self.instanceUrl:
+            return
+
+        # depth first list of the nodes, with the depth in place of the parent
+        rows = []
+        stack = [(child, 0) for child in reversed(self.root.children)]
+        while stack:
+            item, depth = stack.pop()
+            rows.append((depth, int(item.type), item.id, item.title, item.url,
+                         item.size, item.timemodified, item.filepath, int(item.checkState.value), item.fetched,
+                         item.timesynced))
+            stack.extend((child, depth + 1) for child in reversed(item.children))
+
+        path = self.snapshotPath()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # only data, a snapshot is loaded from the cache at every start
+            snapshot = [MoodleTreeModel.snapshotVersion, rows, self.incrementalRefreshes]
+            data = zlib.compress(json.dumps(snapshot, separators=(",", ":")).encode())
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning(f"could not save snapshot of the tree: {e}")
+            return
+
+        log.debug(f"saved snapshot with {len(rows)} items to {path}")
+
+    def loadCatalog(self, instanceUrl):
+        """
+        Replaces the tree with what the catalog contains from earlier
+        refreshes, when there is no snapshot
+        """
+        if not self.catalog:
+            return False
+
+        self.clear()
+        self.instanceUrl = instanceUrl
+
+        for kind, item in moodle.typed(self.catalog.walk()):
+            if kind == moodle.Kind.COURSE:
+                self.pendingBatches.append([])
+            self.pendingBatches[-1].append((MoodleFetcher.itemTypes[kind], item))
+
+        if not self.pendingBatches:
+            return False
+
+        self.insertPendingBatches()
+        log.debug(f"loaded {len(self.courseItems)} courses from the catalog")
+        return True
+
+    def loadSnapshot(self, instanceUrl):
+        """ Replaces the tree with the snapshot saved for the instance, if any """
+        self.instanceUrl = instanceUrl
+        try:
+            snapshot = json.loads(zlib.decompress(self.snapshotPath().read_bytes()))
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            log.warning(f"could not load snapshot of the tree: {e}")
+            return False
+
+        if snapshot[0] != MoodleTreeModel.snapshotVersion:
+            return False
+        # the count goes on across restarts
+        rows, self.incrementalRefreshes = snapshot[1:]
+
+        self.beginResetModel()
+        self.root = MoodleItem(MoodleItem.Type.ROOT)
+        self.lastInsertedItem = None
+        self.courseItems = {}
+        self.titleIndex.clear()
+
+        # calling the enum constructors for every item is slow
+        types = {int(t): t for t in MoodleItem.Type}
+        checkStates = {s.value: s for s in Qt.CheckState}
+
+        try:
+            stack = [self.root]
+            for depth, type, id, title, url, size, timemodified, filepath, checkState, fetched, timesynced in rows:
+                item = MoodleItem(types[type], id = id, url = url, size = size, timemodified = timemodified,
+                                  filepath = filepath)
+                # title is already unescaped
+                item.title = title
+                item.checkState = checkStates[checkState]
+                item.fetched = fetched
+                item.timesynced = timesynced
+                self.titleIndex.add(item, title)
+
+                del stack[depth + 1:]
+                stack[-1].appendChild(item)
+                stack.append(item)
+
+                if item.type == MoodleItem.Type.COURSE:
+                    self.courseItems[item.id] = item
+        except Exception as e:
+            # the file is only data, but it may not be the data expected
+            log.warning(f"could not load snapshot of the tree: {e}")
+            self.root = MoodleItem(MoodleItem.Type.ROOT)
+            self.courseItems = {}
+            self.titleIndex.clear()
+            self.endResetModel()
+            return False
+
+        self.endResetModel()
+        log.debug(f"loaded snapshot with {len(rows)} items")
+        return True
+
     @pyqtSlot()
     def onWorkerDone(self):
-        log.debug("worker done")
+        self.insertPendingBatches()
+
+        stats = self.pool.stats()
+        log.debug(f"worker done, http pool hits: {stats['hits']}, misses: {stats['misses']}")
+
+        # courses that are not there anymore (when refreshing over a snapshot)
+        if self.seenCourses:
+            gone = [item for item in self.root.children if item.id not in self.seenCourses]
+            self.removeItems(self.root, gone)
+
+        self.saveSnapshot()
+
+        if self.lazy:
+            # prefetch recently used courses in the background
+            items = [self.courseItems[c] for c in self.recentCourses() if c in self.courseItems]
+            items = [item for item in items if not item.fetched and not item.pending]
+            if items:
+                self.fetchCourses(items)
 
 
 class QLogHandler(QObject, logging.Handler):
@@ -328,7 +1266,14 @@ class QLogHandler(QObject, logging.Handler):
 class MuddleWindow(QMainWindow):
     def __init__(self, config):
         super(MuddleWindow, self).__init__()
-        uic.loadUi("muddle/muddle.ui", self)
+        if Ui_MuddleWindow:
+            self.ui = Ui_MuddleWindow()
+            self.ui.setupUi(self)
+        else:
+            # parsing the XML at runtime is slow, but works without pyuic6
+            from PyQt6 import uic
+            uic.loadUi(str(pathlib.Path(__file__).with_name("muddle.ui")), self)
+        self.config = config
         self.setCentralWidget(self.findChild(QTabWidget, "Muddle"))
 
         self.instanceUrl = config["server"]["url"] if config.has_option("server", "url") else None
@@ -377,20 +1322,46 @@ class MuddleWindow(QMainWindow):
         self.logsTab = self.findChild(QPlainTextEdit, "logsTab")
         self.logsTab.setFont(f)
 
+        # stats tab, updated only while it is visible
+        self.statsTab = self.findChild(QTreeWidget, "statsTab")
+        self.statsTab.header().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        self.statsTimer = QTimer(self)
+        self.statsTimer.setInterval(1000)
+        self.statsTimer.timeout.connect(self.updateStats)
+        self.findChild(QTabWidget, "Muddle").currentChanged.connect(self.onTabChanged)
+
         # moodle tab
         ## set up proxymodel for moodle treeview
-        self.moodleTreeModel = MoodleTreeModel()
-        self.moodleTreeModel.dataChanged.connect(self.onMoodleTreeModelDataChanged)
+        self.fulltext = fulltext.FullTextIndex.from_config(config)
+        self.catalog = catalog.Catalog.from_config(config)
+        self.moodleTreeModel = MoodleTreeModel(
+            moodle.HttpPool.from_config(config),
+            cache.ResponseCache.from_config(config),
+            maxWorkers = config.getint("http", "max_workers", fallback=4),
+            lazy = config.getboolean("muddle", "lazy_loading", fallback=False),
+            prefetch = config.getint("muddle", "prefetch_courses", fallback=3),
+            incremental = config.getboolean("muddle", "incremental_refresh", fallback=False),
+            fullRefreshEvery = config.getint("muddle", "full_refresh_every", fallback=10),
+            batched = config.getboolean("muddle", "batched_loading", fallback=True),
+            fulltext = self.fulltext,
+            catalog = self.catalog)
 
         self.filterModel = MoodleTreeFilterModel()
         self.filterModel.setRecursiveFilteringEnabled(True)
         self.filterModel.setDynamicSortFilter(True)
         self.filterModel.setSourceModel(self.moodleTreeModel)
 
+        self.moodleTreeModel.batchAboutToBeInserted.connect(self.filterModel.suspendDynamicSortFilter)
+        self.moodleTreeModel.batchInserted.connect(self.filterModel.resumeDynamicSortFilter)
+
         moodleTreeView = self.findChild(QTreeView, "moodleTree")
         moodleTreeView.setModel(self.filterModel)
         moodleTreeView.setSortingEnabled(True)
         moodleTreeView.sortByColumn(0, Qt.SortOrder.AscendingOrder)
+        # all rows have the same height, otherwise the view asks for the size
+        # hint of every row that changed (e.g. all files of a checked course)
+        moodleTreeView.setUniformRowHeights(True)
+        self.moodleTreeModel.checkStatesChanged.connect(moodleTreeView.viewport().update)
         ## TODO: change with minimumSize (?)
         moodleTreeView.header().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
         moodleTreeView.doubleClicked.connect(self.onMoodleTreeViewDoubleClicked)
@@ -407,11 +1378,34 @@ class MuddleWindow(QMainWindow):
             refreshBtn.setEnabled(False)
             log.warning("no server token configured!")
 
+        ## refresh periodically
+        refreshInterval = config.getint("muddle", "refresh_interval", fallback=0)
+        if refreshInterval > 0:
+            self.refreshTimer = QTimer(self)
+            self.refreshTimer.setInterval(refreshInterval * 60 * 1000)
+            self.refreshTimer.timeout.connect(self.onRefreshBtnClicked)
+            self.refreshTimer.start()
+
+        ## show the tree of the last session, and update it in the background
+        if self.instanceUrl and (self.moodleTreeModel.loadSnapshot(self.instanceUrl)
+                                 or self.moodleTreeModel.loadCatalog(self.instanceUrl)):
+            if self.token:
+                self.moodleTreeModel.refresh(self.instanceUrl, self.token)
+
 
         ## searchbar
         searchBar = self.findChild(QLineEdit, "searchBar")
         searchBar.textChanged.connect(self.onSearchBarTextChanged)
-        searchBar.textEdited.connect(self.onSearchBarTextChanged)
+
+        ## search only once the user stops typing
+        self.searchTimer = QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(200)
+        self.searchTimer.timeout.connect(self.search)
+
+        ## search again when items are added to the tree
+        self.moodleTreeModel.rowsInserted.connect(self.onMoodleTreeModelChanged)
+        self.moodleTreeModel.modelReset.connect(self.onMoodleTreeModelChanged)
 
         ## select path
         selectPathBtn = self.findChild(QPushButton, "selectPathBtn")
@@ -420,8 +1414,15 @@ class MuddleWindow(QMainWindow):
         ## progressbar
         self.progressBar = self.findChild(QProgressBar, "downloadProgressBar")
 
-        # self.moodleTreeModel.worker.loaded
-        # self.moodleTreeModel.worker.loadedItem.connect(lambda t, item:)
+        ## download checked items
+        self.downloadWorker = None
+
+        ## files opened with a double click
+        self.previews = cache.PreviewCache.from_config(config)
+        self.openWorkers = {}
+        self.downloadBtn = self.findChild(QPushButton, "downloadBtn")
+        self.downloadBtn.clicked.connect(self.onDownloadBtnClicked)
+        self.downloadBtn.setEnabled(bool(self.instanceUrl and self.token))
 
         # local filesystem tab
         self.downloadPath = QDir.homePath()
@@ -443,7 +1444,7 @@ class MuddleWindow(QMainWindow):
     @pyqtSlot(int)
     def setProgressBarTasks(self, nrTasks):
         self.progressBar.setMinimum(0)
-        self.progressBar.setMaximum(tasks)
+        self.progressBar.setMaximum(nrTasks)
         self.progressBar.reset()
 
     @pyqtSlot()
@@ -455,6 +1456,62 @@ class MuddleWindow(QMainWindow):
     def setProgressBarValue(self, value):
         self.progressBar.setValue(value)
 
+    @pyqtSlot()
+    def onDownloadBtnClicked(self):
+        if self.downloadWorker and not self.downloadWorker.isFinished():
+            self.downloadWorker.downloader.cancel()
+            return
+
+        jobs = [download.Download(
+                    url = item.url,
+                    path = download.local_path(self.downloadPath, *titles),
+                    size = item.size,
+                    timemodified = item.timemodified)
+                for item, titles in self.moodleTreeModel.checkedFiles()]
+
+        if not jobs:
+            log.info("nothing to download, check the files to download first")
+            return
+
+        manifest = sync.Manifest(self.downloadPath)
+        outdated = manifest.outdated(jobs)
+        if len(outdated) < len(jobs):
+            log.info(f"{len(jobs) - len(outdated)} files are up to date")
+        if not outdated:
+            return
+        jobs = outdated
+
+        apihelper = moodle.ApiHelper(moodle.RestApi(self.instanceUrl, self.token, self.moodleTreeModel.pool))
+        downloader = download.Downloader.from_config(apihelper, self.config)
+
+        self.downloadWorker = MoodleDownloader(self, downloader, jobs, manifest, self.fulltext)
+        self.downloadWorker.progress.connect(self.onDownloadProgress)
+        self.downloadWorker.done.connect(self.onDownloadDone)
+
+        log.info(f"downloading {len(jobs)} files to {self.downloadPath}")
+        self.downloadBtn.setText("Cancel")
+        self.onDownloadProgress(0, len(jobs), 0, self.downloadWorker.totalBytes // 1024)
+        self.downloadWorker.start()
+
+    @pyqtSlot(int, int, int, int)
+    def onDownloadProgress(self, filesDone, totalFiles, kibDone, totalKib):
+        # show the progress in bytes, unless the sizes are unknown
+        total, value = (totalKib, min(kibDone, totalKib)) if totalKib > 0 else (totalFiles, filesDone)
+        if self.progressBar.maximum() != total:
+            self.setProgressBarTasks(total)
+
+        self.setProgressBarValue(value)
+
+        self.progressBar.setFormat(f"%p% ({filesDone}/{totalFiles} files)")
+
+    @pyqtSlot(int)
+    def onDownloadDone(self, failed):
+        self.downloadBtn.setText("Download")
+        if failed:
+            log.error(f"{failed} files could not be downloaded")
+        else:
+            log.info("download done")
+
     @pyqtSlot()
     def onRequestTokenBtnClicked(self):
         # TODO: open login dialog
@@ -481,27 +1538,79 @@ class MuddleWindow(QMainWindow):
 
     @pyqtSlot(str)
     def onSearchBarTextChanged(self, text):
+        self.searchTimer.start()
+
+    @pyqtSlot()
+    def onMoodleTreeModelChanged(self):
+        if self.filterModel.matches is not None:
+            self.searchTimer.start()
+
+    @pyqtSlot()
+    def search(self):
         moodleTreeView = self.findChild(QTreeView, "moodleTree")
         searchBar = self.findChild(QLineEdit, "searchBar")
 
-        if not text:
-            self.filterModel.setFilterRegularExpression(".*")
-            moodleTreeView.collapseAll()
-            searchBar.setStyleSheet("")
+        matches = self.moodleTreeModel.titleIndex.search(searchBar.text())
+        if matches is not None and self.fulltext:
+            # also show the items whose summary, description or file contents match
+            keys = set(hit["key"] for hit in self.fulltext.search(searchBar.text(), limit=200))
+            matches |= self.moodleTreeModel.itemsForKeys(keys)
+
+        if matches is None:
+            if self.filterModel.matches is not None:
+                self.filterModel.setMatches(None)
+                moodleTreeView.collapseAll()
         else:
-            regexp = QRegularExpression(text)
-            if regexp.isValid():
-                self.filterModel.setFilterRegularExpression(regexp)
-                moodleTreeView.expandAll()
-                searchBar.setStyleSheet("")
-            else:
-                log.debug("invalid search regular expression, not searching")
-                searchBar.setStyleSheet("QLineEdit { color: red; }")
+            self.filterModel.setMatches(matches)
+            moodleTreeView.expandAll()
 
     @pyqtSlot(str)
     def onNewLogMessage(self, msg):
         self.logsTab.appendPlainText(msg)
 
+    @pyqtSlot(int)
+    def onTabChanged(self, index):
+        if self.findChild(QTabWidget, "Muddle").widget(index) is self.statsTab:
+            self.updateStats()
+            self.statsTimer.start()
+        else:
+            self.statsTimer.stop()
+
+    @pyqtSlot()
+    def updateStats(self):
+        stats = metrics.registry.stats()
+        formatSize = MoodleTreeModel.formatSize
+
+        def ms(seconds):
+            return f"{seconds * 1000:.1f} ms"
+
+        def row(parent, name, calls="", errors="", cached="", latency=None, received=None):
+            columns = [name, str(calls), str(errors), str(cached)]
+            if latency:
+                columns += [ms(latency["mean"]), ms(latency["p95"]), ms(latency["max"])]
+            else:
+                columns += ["", "", ""]
+            columns.append(formatSize(received) if received is not None else "")
+            return QTreeWidgetItem(parent, columns)
+
+        self.statsTab.clear()
+
+        calls = row(self.statsTab, "API calls")
+        # the slowest functions in total first
+        functions = sorted(stats["functions"].items(), key=lambda f: f[1]["latency"]["total"], reverse=True)
+        for function, f in functions:
+            row(calls, function, f["calls"], f["errors"], f["cached"], f["latency"], f["bytes"])
+
+        stages = row(self.statsTab, "Stages")
+        for stage, latency in sorted(stats["stages"].items()):
+            row(stages, stage, latency["count"], latency=latency)
+
+        d = stats["downloads"]
+        row(self.statsTab, f"Downloads ({formatSize(d['throughput'])}/s)", d["files"], d["errors"],
+            received=d["bytes"])
+
+        self.statsTab.expandAll()
+
     @pyqtSlot()
     def onDownloadPathEditEditingFinished(self):
         downloadPathEdit = self.findChild(QLineEdit, "downloadPathEdit")
@@ -547,34 +1656,63 @@ class MuddleWindow(QMainWindow):
         realIndex = self.filterModel.mapToSource(index)
         item = self.moodleTreeModel.itemFromIndex(realIndex)
 
-        if item.metadata.type == MoodleItem.Type.FILE:
-            log.debug(f"started download from {item.metadata.url}")
-
-            filepath = tempfile.gettempdir()+"/"+item.metadata.title
-            self.moodleTreeModel.worker.apihelper.get_file(item.metadata.url, filepath)
-
-            if platform.system() == 'Darwin':       # macOS
-                subprocess.Popen(('open', filepath))
-            elif platform.system() == 'Windows':    # Windows
-                os.startfile(filepath)
-            else:                                   # linux variants
-                subprocess.Popen(('xdg-open', filepath))
-
-    # this is here to emulate the behavior of setAutoTristate which does not
-    # work because of a Qt Bug, see https://bugreports.qt.io/browse/QTBUG-59173
-    @pyqtSlot(QModelIndex, QModelIndex)
-    def onMoodleTreeModelDataChanged(self, topLeft, bottomRight):
-        # TODO: this can probably be moved in Item.setData() by creating AutoTriStateRole
-        item = self.moodleTreeModel.itemFromIndex(topLeft)
-
-        if item.hasChildren():
-            for i in range(0, item.rowCount()):
-                # NOTE: this causes the child to emit a signal, which
-                # automatically causes to recursively set its children
-                item.child(i).setCheckState(item.checkState())
+        if item.type != MoodleItem.Type.FILE or item in self.openWorkers:
+            return
 
+        path = self.previews.get(item.url, item.timemodified, item.title)
+        if path:
+            log.debug(f"opening {item.url} from the preview cache")
+            MuddleWindow.openFile(path)
+            return
 
-def start(config):
+        log.debug(f"started download from {item.url}")
+        apihelper = moodle.ApiHelper(moodle.RestApi(self.instanceUrl, self.token, self.moodleTreeModel.pool))
+        worker = MoodleFileOpener(self, apihelper, self.previews, item)
+        worker.progress.connect(self.moodleTreeModel.setItemProgress)
+        worker.done.connect(self.onFileOpenerDone)
+        self.openWorkers[item] = worker
+
+        self.moodleTreeModel.setItemProgress(item, 0)
+        worker.start()
+
+    @pyqtSlot(object, object)
+    def onFileOpenerDone(self, item, path):
+        self.openWorkers.pop(item).wait()
+        self.moodleTreeModel.setItemProgress(item, None)
+        if path:
+            MuddleWindow.openFile(path)
+
+    @staticmethod
+    def openFile(path):
+        """ Opens a file with the default application """
+        if platform.system() == 'Darwin':       # macOS
+            subprocess.Popen(('open', path))
+        elif platform.system() == 'Windows':    # Windows
+            os.startfile(path)
+        else:                                   # linux variants
+            subprocess.Popen(('xdg-open', path))
+
+
+def start(config, profile=None):
+    """
+    profile is an optional object with mark(phase) and report() methods,
+    that measures the time of the phases of the startup
+    """
+    if profile:
+        profile.mark("import gui")
+
+    trace.thread_name("GUI")
+
+    # required by QtWebEngine if it is imported after the QApplication is created
+    QCoreApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
+    if profile:
+        profile.mark("create QApplication")
+
     ex = MuddleWindow(config)
+    if profile:
+        profile.mark("create MuddleWindow")
+        # runs when the event loop starts, after the window is shown
+        QTimer.singleShot(0, lambda: (profile.mark("show window"), profile.report()))
+
     sys.exit(app.exec())
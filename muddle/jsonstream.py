@@ -0,0 +1,83 @@
+import re
+import json
+import codecs
+
+
+class NotAnArray(ValueError):
+    """ Raised by iter_array if the document is not an array, value is the decoded document """
+    def __init__(self, value):
+        super().__init__("the document is not an array")
+        self.value = value
+
+
+_separator = re.compile(r"[\s,]*")
+_decoder = json.JSONDecoder()
+_after_number = ", \t\r\n]"
+
+
+def iter_array(chunks):
+    """
+    Yields the elements of the JSON array in chunks (an iterable of UTF-8
+    bytes, for example the iter_content of a streamed response) as soon as
+    each of them is complete, without waiting for the rest of the document.
+
+    Only the text of the elements that are not complete yet is kept in
+    memory. Raises ValueError if the document is malformed and NotAnArray
+    if it is not an array (e.g. a moodle exception).
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+
+    # the opening bracket
+    for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        if buffer.strip():
+            break
+    else:
+        raise ValueError("empty document")
+
+    buffer = buffer.lstrip()
+    if not buffer.startswith("["):
+        rest = "".join(utf8.decode(chunk) for chunk in chunks) + utf8.decode(b"", final=True)
+        raise NotAnArray(json.loads(buffer + rest))
+
+    pos = 1
+    # Decoding an element that is not complete fails only at its end, so it
+    # is tried again only once the buffer has doubled. This bounds the work
+    # on a large element to a few times that of decoding it once.
+    retry_size = 0
+    finished = False
+
+    while True:
+        pos = _separator.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+
+        if pos < len(buffer) and len(buffer) - pos >= retry_size:
+            try:
+                value, end = _decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if finished:
+                    raise
+                retry_size = 2 * (len(buffer) - pos)
+            else:
+                # a number is complete only once something else follows it
+                if finished or not isinstance(value, (int, float)) or isinstance(value, bool) \
+                        or (end < len(buffer) and buffer[end] in _after_number):
+                    yield value
+                    # forget what was decoded
+                    buffer, pos, retry_size = buffer[end:], 0, 0
+                    continue
+
+        if finished:
+            raise ValueError("the document ended before the end of the array")
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+            buffer += utf8.decode(b"", final=True)
+            # try a last time, whatever the size
+            retry_size = 0
+        else:
+            buffer += utf8.decode(chunk)
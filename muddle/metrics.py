@@ -0,0 +1,154 @@
+import json
+import time
+import bisect
+import logging
+import threading
+import contextlib
+
+log = logging.getLogger("muddle.metrics")
+
+
+class Histogram:
+    """
+    Distribution of durations in fixed buckets (upper bounds in seconds),
+    small enough to keep one for every wsfunction
+    """
+
+    bounds = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(Histogram.bounds)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(Histogram.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """ Returns the upper bound of the bucket of the q-quantile (at most max) """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(Histogram.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def todict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+            "buckets": {("inf" if b == float("inf") else str(b)): c
+                        for b, c in zip(Histogram.bounds, self.counts) if c},
+        }
+
+
+class Metrics:
+    """
+    Counters of the api calls (per wsfunction), of the downloads and of the
+    time spent in the stages of a refresh (e.g. decoding the responses or
+    inserting the items in the tree), shared by all threads
+
+    The module level `registry` is used by RestApi, ApiHelper and the GUI.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.functions = {}
+            self.stages = {}
+            self.downloads = {"files": 0, "errors": 0, "bytes": 0, "seconds": 0.0}
+
+    def _function(self, function):
+        stats = self.functions.get(function)
+        if stats is None:
+            stats = self.functions[function] = {
+                "calls": 0, "errors": 0, "cached": 0, "bytes": 0, "latency": Histogram()}
+        return stats
+
+    def record_call(self, function, seconds, nbytes=0, error=False):
+        """ Records a call of function to the server, that took seconds (with retries) """
+        with self._lock:
+            stats = self._function(function)
+            stats["calls"] += 1
+            stats["bytes"] += nbytes
+            stats["errors"] += int(error)
+            stats["latency"].add(seconds)
+
+    def record_bytes(self, function, nbytes):
+        """ Adds the size of the body of a streamed response, read after the call was recorded """
+        with self._lock:
+            self._function(function)["bytes"] += nbytes
+
+    def record_cached(self, function):
+        """ Records a call of function answered by the response cache """
+        with self._lock:
+            self._function(function)["cached"] += 1
+
+    def record_download(self, nbytes, seconds, error=False):
+        with self._lock:
+            self.downloads["files"] += 1
+            self.downloads["errors"] += int(error)
+            self.downloads["bytes"] += nbytes
+            self.downloads["seconds"] += seconds
+
+    def record_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.add(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        """ Records the time spent in the with block as stage """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start)
+
+    def stats(self):
+        """ Returns all the counters as a dictionary that can be dumped as JSON """
+        with self._lock:
+            functions = {name: dict(stats, latency=stats["latency"].todict())
+                         for name, stats in self.functions.items()}
+            downloads = dict(self.downloads)
+            stages = {name: histogram.todict() for name, histogram in self.stages.items()}
+            started = self.started
+
+        # average rate of a download, downloads run concurrently
+        downloads["throughput"] = downloads["bytes"] / downloads["seconds"] if downloads["seconds"] else 0.0
+        return {
+            "started": started,
+            "uptime": time.time() - started,
+            "functions": functions,
+            "downloads": downloads,
+            "stages": stages,
+        }
+
+    def dump(self, path):
+        try:
+            with open(path, "w") as f:
+                json.dump(self.stats(), f, indent=1)
+        except OSError as e:
+            log.error(f"could not write the statistics to {path}: {e}")
+
+
+registry = Metrics()
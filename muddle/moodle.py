@@ -1,9 +1,27 @@
 #!/usr/bin/env python3
 import requests
+import requests.adapters
 import logging
+import re
+import os
+import glob
+import shutil
+import pathlib
+import threading
+import time
+import collections
+import queue
+import concurrent.futures
 import dataclasses
+import enum
+import typing
 
-from typing import List
+from typing import List, Optional
+
+from . import jsonstream
+from . import metrics
+from . import retry
+from . import trace
 
 log = logging.getLogger("muddle.moodle")
 
@@ -19,60 +37,613 @@ def get_token(url, user, password):
     return requests.post(token_url, data=data)
 
 
+def encode_params(params, prefix=None):
+    """
+    Flattens nested lists and dictionaries into the form encoding used by
+    moodle for array parameters, for example
+
+        {"courseids": [1, 2], "options": [{"name": "cmid", "value": 3}]}
+
+    becomes
+
+        {"courseids[0]": 1, "courseids[1]": 2,
+         "options[0][name]": "cmid", "options[0][value]": 3}
+    """
+    flat = {}
+    for key, value in params.items():
+        name = f"{prefix}[{key}]" if prefix is not None else str(key)
+        if isinstance(value, dict):
+            flat.update(encode_params(value, name))
+        elif isinstance(value, (list, tuple)):
+            flat.update(encode_params(dict(enumerate(value)), name))
+        elif isinstance(value, bool):
+            flat[name] = int(value)
+        else:
+            flat[name] = value
+
+    return flat
+
+
+class CountingAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter that counts the requests it sends and the connections it
+    opens. urllib3 reconnects a dropped connection with the same object,
+    so the sockets are counted where they are opened.
+    """
+    def __init__(self, **kwargs):
+        self.requests = 0
+        self.connections = 0
+        self._count_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def counting(pool_cls):
+            class Connection(pool_cls.ConnectionCls):
+                def connect(self):
+                    # a failed attempt is a miss too
+                    with adapter._count_lock:
+                        adapter.connections += 1
+                    super().connect()
+
+            return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": Connection})
+
+        manager = self.poolmanager
+        manager.pool_classes_by_scheme = {scheme: counting(cls) for scheme, cls in manager.pool_classes_by_scheme.items()}
+
+    def send(self, *args, **kwargs):
+        with self._count_lock:
+            self.requests += 1
+        return super().send(*args, **kwargs)
+
+
+class HttpPool:
+    """
+    Pool of keep-alive HTTP connections, shared by all threads that use it.
+
+    Each thread gets its own requests.Session (sessions are not thread-safe)
+    but all sessions are mounted on the same adapter, so the underlying
+    urllib3 connection pools are shared and connections are reused across
+    threads.
+    """
+    def __init__(self, pool_size=10, keep_alive=True, timeout=(10, 60), retry_policy=None,
+                 rate_limit=0, rate_burst=10, breaker_threshold=5, breaker_timeout=30):
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._adapter = CountingAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self._local = threading.local()
+
+        # how failed api calls are retried, and the rate limit and circuit
+        # breaker of every instance, see RestApi._post
+        self.retry = retry_policy or retry.RetryPolicy()
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.breaker_threshold = breaker_threshold
+        self.breaker_timeout = breaker_timeout
+        self._limits = {}
+        self._limits_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates a pool using the values in the [http] section of the config
+        """
+        if not config.has_section("http"):
+            return cls()
+
+        http = config["http"]
+        return cls(
+            pool_size=http.getint("pool_size", 10),
+            keep_alive=http.getboolean("keep_alive", True),
+            timeout=(http.getfloat("connect_timeout", 10),
+                     http.getfloat("read_timeout", 60)),
+            retry_policy=retry.RetryPolicy(
+                retries=http.getint("retries", 3),
+                backoff=http.getfloat("backoff", 0.5),
+                backoff_max=http.getfloat("backoff_max", 30)),
+            rate_limit=http.getfloat("rate_limit", 0),
+            rate_burst=http.getint("rate_burst", 10),
+            breaker_threshold=http.getint("breaker_threshold", 5),
+            breaker_timeout=http.getfloat("breaker_timeout", 30))
+
+    def limits(self, url):
+        """
+        Returns the (retry.TokenBucket, retry.CircuitBreaker) of the instance
+        at url, they are shared by all its RestApi objects. The bucket is None
+        if there is no rate limit.
+        """
+        with self._limits_lock:
+            limits = self._limits.get(url)
+            if limits is None:
+                bucket = retry.TokenBucket(self.rate_limit, self.rate_burst) if self.rate_limit > 0 else None
+                limits = self._limits[url] = (bucket, retry.CircuitBreaker(self.breaker_threshold,
+                                                                           self.breaker_timeout))
+            return limits
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            if not self.keep_alive:
+                session.headers["Connection"] = "close"
+            self._local.session = session
+
+        return session
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def stats(self):
+        """
+        Returns the number of requests that reused a pooled connection (hits)
+        and the number of requests that had to open a new one (misses)
+        """
+        adapter = self._adapter
+        with adapter._count_lock:
+            requests_made, connections = adapter.requests, adapter.connections
+
+        return {"hits": requests_made - connections, "misses": connections}
+
+
 class RestApi:
     """
     Magic REST API wrapper (ab)using lambdas
     """
-    def __init__(self, instance_url, token=None):
+    def __init__(self, instance_url, token=None, pool=None, cache=None):
         self._url = instance_url
-        if token:
-            self._token = token
+        self._token = token
+        self.pool = pool or HttpPool()
+        # optional cache.ResponseCache
+        self.cache = cache
+        # per thread, see oldest_cached()
+        self._local = threading.local()
 
     def __getattr__(self, key):
-        return lambda **kwargs: RestApi._call(self._url, self._token, str(key), **kwargs)
+        # do not turn private or dunder lookups (copy, pickle, ...) into calls
+        if key.startswith("_"):
+            raise AttributeError(key)
+
+        return lambda **kwargs: self._call(str(key), **kwargs)
 
     def _call(self, function, **kwargs):
-        return RestApi._call(self._url, self._token, kwargs)
+        params = encode_params(kwargs)
 
-    @staticmethod
-    def _call(url, token, function, **kwargs):
-        api_url = f"{url}/webservice/rest/server.php?moodlewsrestformat=json"
-        data = {"wstoken": token, "wsfunction": function}
-        for k, v in kwargs.items():
-            data[str(k)] = v
+        if self.cache and self.cache.is_cacheable(function):
+            fetched = []
+            req = self.cache.lookup(self._url, self._token, function, params,
+                                    lambda: fetched.append(True) or self._post(function, params))
+            if not fetched:
+                metrics.registry.record_cached(function)
+                if req is not None:
+                    received = time.time() - req.age
+                    oldest = getattr(self._local, "oldest", None)
+                    self._local.oldest = received if oldest is None else min(oldest, received)
+            return req
+
+        return self._post(function, params)
+
+    def oldest_cached(self):
+        """
+        Returns when the oldest response served from the cache in this
+        thread since the previous call was received from the server, or None
+        if no response was served from the cache
+        """
+        oldest = getattr(self._local, "oldest", None)
+        self._local.oldest = None
+        return oldest
+
+    def stream(self, function, **kwargs):
+        """
+        Calls function without reading the body of the response, which can
+        then be read with iter_content while it arrives. The response is
+        not cached and moodle exceptions are not detected, the caller must
+        close it. Returns None if the call failed.
+        """
+        return self._post(function, encode_params(kwargs), stream=True)
+
+    def _post(self, function, params, stream=False):
+        start = time.perf_counter()
+        req = None
+        with trace.span(function, stream=stream) as span:
+            try:
+                req = self._send(function, params, stream)
+                return req
+            finally:
+                # the size of a streamed body is recorded once it is read
+                nbytes = len(req.content) if req is not None and not stream else 0
+                span.set(bytes=nbytes, error=req is None)
+                metrics.registry.record_call(function, time.perf_counter() - start, nbytes, req is None)
+
+    def _send(self, function, params, stream=False):
+        """
+        Calls function, retrying transient failures (connection errors,
+        timeouts, 429 and 5xx) with the retry policy of the pool. Returns the
+        response, or None if the call failed or moodle returned an exception.
+        """
+        api_url = f"{self._url}/webservice/rest/server.php?moodlewsrestformat=json"
+        data = {"wstoken": self._token, "wsfunction": function}
+        data.update(params)
+
+        policy = self.pool.retry
+        bucket, breaker = self.pool.limits(self._url)
 
         log.debug(f"calling api with POST to {api_url} with DATA {data}")
-        try:
-            req = requests.post(api_url, data=data)
-            req.raise_for_status()
-        except requests.HTTPError:
-            log.warn("Error code returned by HTTP(s) request")
-        except (requests.ConnectionError, requests.Timeout, requests.ReadTimeout) as e:
-            log.error(f"Failed to connect for POST request:\n{str(e)}")
-        finally:
+        for attempt in range(policy.retries + 1):
+            if not breaker.allow():
+                log.error(f"not calling {function}, {self._url} failed too many times in a row")
+                return None
+            if bucket:
+                bucket.acquire()
+
+            retry_after = None
+            try:
+                req = self.pool.post(api_url, data=data, stream=stream)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                log.warning(f"Failed to connect for POST request ({function}, attempt {attempt + 1}):\n{str(e)}")
+            else:
+                if req.status_code not in policy.statuses:
+                    # the server answered, even if it is an error
+                    breaker.record_success()
+                    return RestApi._checked(function, req, stream)
+
+                retry_after = policy.retry_after(req)
+                if stream:
+                    req.close()
+                log.warning(f"{function} returned HTTP {req.status_code} (attempt {attempt + 1})")
+
+            breaker.record_failure()
+            if attempt < policy.retries:
+                time.sleep(policy.delay(attempt, retry_after))
+
+        log.error(f"giving up on {function} after {policy.retries + 1} attempts")
+        return None
+
+    # errors are returned with status 200 as {"exception": ..., "errorcode": ..., "message": ...}
+    exception_pattern = re.compile(rb'\s*\{\s*"exception"\s*:')
+    # what a JSON document can start with, not an HTML page of a proxy or of maintenance mode
+    json_pattern = re.compile(rb'\s*[\[{"0-9tfn-]')
+
+    @staticmethod
+    def _checked(function, req, stream=False):
+        """
+        Returns req, or None if it is an HTTP error, a moodle exception or
+        not JSON.
+        The body of a streamed response has not been read yet, only its
+        status is checked.
+        """
+        if not req.ok:
+            log.error(f"{function} returned HTTP {req.status_code}")
+            if stream:
+                req.close()
+            return None
+
+        if stream:
             return req
 
+        if RestApi.exception_pattern.match(req.content):
+            try:
+                error = req.json()
+            except ValueError:
+                error = {}
+            log.error(f"{function} failed: {error.get('errorcode')}: {error.get('message')}")
+            return None
+
+        if not RestApi.json_pattern.match(req.content):
+            log.error(f"{function} returned something that is not JSON: {req.content[:80]!r}")
+            return None
+
+        return req
+
+
+class Kind(enum.Enum):
+    """
+    Kind of the nodes of the tree yielded by MoodleInstance.walk()
+    """
+    COURSE = "course"
+    SECTION = "section"
+    MODULE = "module"
+    CONTENT = "content"
+
 
 class MoodleInstance:
     """
     A more frendly API that wraps around the raw RestApi
     """
-    def __init__(self, url, token):
-        self.api = RestApi(url, token)
+    def __init__(self, url, token, pool=None, cache=None, catalog=None):
+        self.api = RestApi(url, token, pool, cache)
         self.userid = None
+        # if given (a catalog.Catalog), the courses and their contents are
+        # stored in it as they are fetched
+        self.catalog = catalog
 
     def get_userid(self):
         if self.userid is None:
             req = self.api.core_webservice_get_site_info()
+            if not req:
+                log.error("failed to get the site info")
+                return None
             self.userid = req.json()["userid"]
 
         return self.userid
 
     def get_enrolled_courses(self):
         req = self.api.core_enrol_get_users_courses(userid=self.get_userid())
+        if not req:
+            return
         for c in req.json():
             yield Course._fromdict(c)
 
+    def get_user_courses(self):
+        """
+        Returns the courses the user is enrolled in as dictionaries (as
+        needed by walk), or None if the request failed
+        """
+        userid = self.get_userid()
+        req = self.api.core_enrol_get_users_courses(userid=userid) if userid is not None else None
+        if not req:
+            log.error("failed to get the enrolled courses")
+            return None
+
+        courses = [course for course in req.json() if "id" in course]
+        if self.catalog:
+            self.catalog.store_courses(courses)
+
+        return courses
+
+    def get_course_contents(self, courseid, on_section=None):
+        """
+        Returns the list of sections (with their modules and contents) of a
+        course as returned by the REST api, or None if the request failed
+
+        If given, on_section is called with every section in order. Unless
+        the responses are cached the response is then decoded while it
+        arrives and on_section is called as soon as a section is complete,
+        before the rest of the course has been received.
+        """
+        cache = self.api.cache
+        if on_section is not None and not (cache and cache.is_cacheable("core_course_get_contents")):
+            return self._stream_course_contents(courseid, on_section)
+
+        req = self.api.core_course_get_contents(courseid=str(courseid))
+        if not req:
+            log.error(f"failed to get contents of course {courseid}")
+            return None
+
+        with metrics.registry.timed("decode"), trace.span("decode", courseid=courseid):
+            sections = req.json()
+
+        for section in sections if on_section is not None else []:
+            on_section(section)
+        return sections
+
+    # size of the reads of a streamed response
+    stream_chunk_size = 64 * 1024
+
+    def _stream_course_contents(self, courseid, on_section):
+        req = self.api.stream("core_course_get_contents", courseid=str(courseid))
+        if req is None:
+            log.error(f"failed to get contents of course {courseid}")
+            return None
+
+        sections = []
+        nbytes = 0
+
+        def chunks():
+            nonlocal nbytes
+            for chunk in req.iter_content(MoodleInstance.stream_chunk_size):
+                nbytes += len(chunk)
+                yield chunk
+
+        try:
+            with req, trace.span("stream contents", courseid=courseid) as span:
+                for section in jsonstream.iter_array(chunks()):
+                    sections.append(section)
+                    on_section(section)
+                span.set(bytes=nbytes, sections=len(sections))
+            return sections
+        except jsonstream.NotAnArray as e:
+            error = e.value if isinstance(e.value, dict) else {}
+            log.error(f"failed to get contents of course {courseid}: {error.get('errorcode')}: {error.get('message')}")
+            return None
+        except (requests.RequestException, ValueError) as e:
+            log.warning(f"the contents of course {courseid} broke off after {len(sections)} sections, "
+                        f"fetching them again: {e}")
+        finally:
+            metrics.registry.record_bytes("core_course_get_contents", nbytes)
+
+        # the sections that were already passed to on_section are not passed again
+        refetched = self.get_course_contents(courseid)
+        for section in (refetched or [])[len(sections):]:
+            on_section(section)
+        return refetched
+
+    def get_updated_modules(self, courseid, since):
+        """
+        Returns the ids of the modules of a course that changed since the
+        given timestamp, or None if moodle could not tell
+        """
+        req = self.api.core_course_get_updates_since(courseid=str(courseid), since=int(since))
+        if not req:
+            return None
+
+        updates = req.json()
+        if not isinstance(updates, dict) or "instances" not in updates:
+            log.error(f"failed to get updates of course {courseid}")
+            return None
+
+        return [i["id"] for i in updates["instances"] if i["contextlevel"] == "module"]
+
+    def get_module_contents(self, courseid, cmid):
+        """
+        Returns the sections of a course, each containing only the module
+        cmid if it is in that section
+        """
+        req = self.api.core_course_get_contents(
+            courseid=str(courseid), options=[{"name": "cmid", "value": str(cmid)}])
+        if not req:
+            log.error(f"failed to get module {cmid} of course {courseid}")
+            return None
+
+        with metrics.registry.timed("decode"), trace.span("decode", courseid=courseid):
+            return req.json()
+
+    def get_course_changes(self, courseid, since, max_modules=10, on_section=None):
+        """
+        Returns a tuple (sections, incremental). If incremental is true the
+        sections contain only the modules that changed since the given
+        timestamp, otherwise they are the whole contents of the course, and
+        on_section is called as in get_course_contents.
+        """
+        cmids = self.get_updated_modules(courseid, since)
+
+        # asking for each module is slower than getting the whole course
+        if cmids is None or len(cmids) > max_modules:
+            return self.get_course_contents(courseid, on_section), False
+
+        sections = {}
+        for cmid in cmids:
+            contents = self.get_module_contents(courseid, cmid)
+            if contents is None:
+                return self.get_course_contents(courseid, on_section), False
+
+            for section in contents:
+                if section["id"] in sections:
+                    sections[section["id"]]["modules"] += section.get("modules", [])
+                else:
+                    sections[section["id"]] = section
+
+        # sections where nothing changed are not needed
+        return [s for s in sections.values() if s.get("modules")], True
+
+    def walk(self, courses, max_workers=4, since=None):
+        """
+        Walks the tree of the given courses (dictionaries as returned by
+        core_enrol_get_users_courses) and yields (Kind, dict) tuples in
+        depth-first order: a course, then its sections, each followed by
+        its modules, each followed by its contents.
+
+        The contents of up to max_workers courses are downloaded
+        concurrently, but the order of the yielded items is the same as if
+        they were downloaded one after another. The sections of a course are
+        yielded while the rest of it is still being received.
+
+        since is an optional dictionary of course ids and timestamps, for
+        those courses only the modules that changed since the timestamp are
+        yielded. To tell them apart the yielded courses have two additional
+        keys: "incremental", which is true if only changes were fetched, and
+        "timesynced", the timestamp to pass in since for the next walk (None
+        if the contents could not be fetched). If the contents of a course
+        break off after some of its sections were yielded, timesynced is set
+        to None in the already yielded course. If the contents were served
+        from the response cache, timesynced is when they were received from
+        the server.
+        """
+        since = since or {}
+
+        def fetch(course, synced, received):
+            # responses served from the cache are older than the walk, the
+            # changes made since they were received must not be skipped
+            # by the next walk
+            self.api.oldest_cached()
+
+            def cached_since():
+                oldest = self.api.oldest_cached()
+                if oldest is not None:
+                    synced[0] = min(synced[0], oldest - 5 * 60)
+
+            def on_section(section):
+                cached_since()
+                received.put(section)
+
+            try:
+                with trace.span("fetch course", id=course["id"], incremental=course["id"] in since):
+                    try:
+                        if course["id"] in since:
+                            sections, incremental = self.get_course_changes(course["id"], since[course["id"]],
+                                                                            on_section=on_section)
+                        else:
+                            sections, incremental = self.get_course_contents(course["id"], on_section), False
+                    except Exception:
+                        # e.g. a response that is not valid JSON, the other courses are still walked
+                        log.exception(f"failed to get contents of course {course['id']}")
+                        sections, incremental = None, False
+
+                    if self.catalog and sections is not None:
+                        with trace.span("store course", id=course["id"]):
+                            self.catalog.store_course(course, sections, incremental)
+            finally:
+                cached_since()
+                # no more sections
+                received.put(None)
+
+            return sections, incremental
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            window = collections.deque()
+            try:
+                for course in courses:
+                    # moodle and local clocks may not agree, be conservative
+                    synced = [time.time() - 5 * 60]
+                    received = queue.SimpleQueue()
+                    future = executor.submit(fetch, course, synced, received)
+                    window.append((course, synced, future, received))
+                    # keep max_workers requests in flight while yielding
+                    if len(window) > max_workers:
+                        yield from MoodleInstance._walk_course(*window.popleft())
+
+                while window:
+                    yield from MoodleInstance._walk_course(*window.popleft())
+            finally:
+                # do not wait for courses that will never be consumed
+                for _, _, future, _ in window:
+                    future.cancel()
+
+    @staticmethod
+    def _walk_course(course, synced, future, received):
+        """ synced is a list whose only element is the timesynced of the course, set by fetch """
+        course = dict(course)
+
+        # time spent by the consumer waiting for the server
+        with trace.span("wait for course", id=course["id"]):
+            section = received.get()
+
+        # sections that arrive one by one are always the whole contents
+        yielded = 0
+        if section is not None:
+            course["timesynced"] = synced[0]
+            course["incremental"] = False
+            yield Kind.COURSE, course
+
+            while section is not None:
+                yield from MoodleInstance._walk_section(section)
+                yielded += 1
+                section = received.get()
+
+        sections, incremental = future.result()
+        if not yielded:
+            course["timesynced"] = synced[0] if sections is not None else None
+            course["incremental"] = incremental
+            yield Kind.COURSE, course
+        elif sections is None:
+            course["timesynced"] = None
+
+        for section in (sections or [])[yielded:]:
+            yield from MoodleInstance._walk_section(section)
+
+    @staticmethod
+    def _walk_section(section):
+        yield Kind.SECTION, section
+        for module in section.get("modules", []):
+            yield Kind.MODULE, module
+            for content in module.get("contents", []):
+                yield Kind.CONTENT, content
+
 
 class ApiHelper:
     def __init__(self, api):
@@ -85,33 +656,223 @@ class ApiHelper:
         else:
             return None
 
-    def get_file(self, url, local_path):
-        with requests.post(url, data={"token": self.api._token}, stream=True) as r:
+    def get_file(self, url, local_path, progress=None, filesize=None, timemodified=None,
+                 segments=1, segment_threshold=64 * 1024 * 1024):
+        """
+        Downloads a file, progress is called with the number of bytes of
+        every chunk that is written.
+
+        The file is first written to a .part file next to local_path, if
+        the download is interrupted the next call continues where it
+        stopped using an HTTP range request. When the file is complete its
+        size is checked against filesize (if given) and it is renamed to
+        local_path, with timemodified as modification time. A partial file
+        of a different timemodified is never resumed.
+
+        If segments > 1 files larger than segment_threshold are downloaded
+        in as many ranges in parallel.
+        """
+        local_path = pathlib.Path(local_path)
+        part = local_path.with_name(f"{local_path.name}.{timemodified or 0}.part")
+
+        # partial downloads of older versions of the file, not of other
+        # files whose name starts with this one (e.g. slides.pdf.zip)
+        own_part = re.compile(rf"{re.escape(local_path.name)}\.\d+\.part\d*")
+        resumed = 0
+        for old in local_path.parent.glob(f"{glob.escape(local_path.name)}.*.part*"):
+            if not own_part.fullmatch(old.name):
+                continue
+            if not old.name.startswith(part.name):
+                old.unlink()
+            else:
+                resumed += old.stat().st_size
+
+        start = time.perf_counter()
+        try:
+            with trace.span("download", url=url, size=filesize):
+                size = self._get_file(url, part, progress, filesize, segments, segment_threshold)
+        except Exception:
+            metrics.registry.record_download(0, time.perf_counter() - start, error=True)
+            raise
+
+        # what was already there was not received now
+        metrics.registry.record_download(max(0, size - resumed), time.perf_counter() - start)
+
+        os.replace(part, local_path)
+        if timemodified:
+            os.utime(local_path, (timemodified, timemodified))
+
+    def _get_file(self, url, part, progress, filesize, segments, segment_threshold):
+        """ Downloads url into part, returns its size """
+        if segments > 1 and filesize and filesize >= segment_threshold:
+            if not self._get_segments(url, part, filesize, segments, progress):
+                log.debug(f"server does not support ranges, downloading {url} at once")
+                self._get_range(url, part, progress)
+        else:
+            self._get_range(url, part, progress)
+
+        size = part.stat().st_size
+        if filesize is not None and size != filesize:
+            # resuming it would fail the same way
+            part.unlink()
+            raise IOError(f"downloaded {size} bytes of {url} instead of {filesize}")
+
+        return size
+
+    def _get_range(self, url, path, progress=None, offset=0, end=None):
+        """
+        Downloads the bytes from offset to end (inclusive, by default the end
+        of the file) into path, continuing after what path already contains.
+        Returns False if the server ignored the range.
+        """
+        resumed = path.stat().st_size if path.exists() else 0
+        if progress and resumed:
+            progress(resumed)
+
+        start = offset + resumed
+        if end is not None and start > end:
+            return True
+
+        headers = {}
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+
+        with self.api.pool.post(url, data={"token": self.api._token}, headers=headers, stream=True) as r:
+            # nothing left to download
+            if r.status_code == 416:
+                return True
+
             r.raise_for_status()
-            with open(local_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
+            if headers and r.status_code != 206:
+                if offset or end is not None:
+                    return False
+                # the server sends the whole file again
+                if progress and resumed:
+                    progress(-resumed)
+                resumed = 0
+
+            with open(path, "ab" if resumed else "wb") as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
                     if chunk:
                         f.write(chunk)
+                        if progress:
+                            progress(len(chunk))
+
+        return True
+
+    def _get_segments(self, url, part, filesize, segments, progress=None):
+        """
+        Downloads a file in parallel ranges, each one into its own resumable
+        file that are joined into part at the end
+        """
+        if part.exists():
+            # a previous attempt that was not segmented
+            part.unlink()
+
+        step = -(-filesize // segments)
+        ranges = [(i, start, min(start + step, filesize) - 1)
+                  for i, start in enumerate(range(0, filesize, step))]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=segments) as executor:
+            results = list(executor.map(
+                lambda r: self._get_range(url, part.with_name(f"{part.name}{r[0]}"), progress, r[1], r[2]),
+                ranges))
+
+        if not all(results):
+            for i, _, _ in ranges:
+                path = part.with_name(f"{part.name}{i}")
+                if path.exists():
+                    path.unlink()
+            return False
+
+        with open(part, "wb") as f:
+            for i, _, _ in ranges:
+                path = part.with_name(f"{part.name}{i}")
+                with open(path, "rb") as segment:
+                    shutil.copyfileobj(segment, f)
+                path.unlink()
+
+        return True
+
 
+# Typed view of the dictionaries returned by the REST api. Only the fields
+# used by muddle are kept, the other keys are ignored.
+
+# decoders of the schema classes, built on first use (see SchemaObj._decoder)
+_decoders = {}
 
-# A bare minimum impl of Moodle SCHEMA
-# This is an experiment and not currently in use!
-# Beware that lots of parameters have been omitted
 
 class SchemaObj:
+    """
+    Base of the schema classes, which are dataclasses with __slots__ since
+    there can be tens of thousands of them. Missing keys are decoded as
+    the default of the field in _defaults, or None.
+
+    A subclass that sets _variant_key is decoded as the class in _variants
+    named by that key of the dictionary, if there is one (e.g. a Module
+    whose modname is "folder" is a Folder).
+    """
+    __slots__ = ()
+
+    _defaults = {}
+    _variant_key = None
+    _variants = {}
+
     @classmethod
-    def _fromdict(cls, d):
+    def _decoder(cls):
+        """
+        Returns a tuple (all, shallow) of lists of (name, default, decode)
+        for the fields of the class, in order. decode decodes the list of
+        nested objects of the field, it is None for the other fields. The
+        shallow decoder leaves the nested lists empty.
+        """
+        decoders = _decoders.get(cls)
+        if decoders is None:
+            if cls is SchemaObj:
+                raise TypeError("Must be used in a subclass")
+
+            # the annotations can refer to classes defined after this one
+            hints = typing.get_type_hints(cls)
+            full, shallow = [], []
+            for field in dataclasses.fields(cls):
+                default = cls._defaults.get(field.name)
+                decode = None
+                args = getattr(hints[field.name], "__args__", None) or ()
+                if args and isinstance(args[0], type) and issubclass(args[0], SchemaObj):
+                    decode = args[0]._fromlist
+                    # shared by all objects without nested objects
+                    default = ()
+                full.append((field.name, default, decode))
+                shallow.append((field.name, default, decode and SchemaObj._skip))
+
+            decoders = _decoders[cls] = (full, shallow)
+
+        return decoders
+
+    # NOTE: not traced, a span per call doubles the time spent decoding,
+    # typed() records them only while tracing
+    @classmethod
+    def _fromdict(cls, d, nested=True):
         """
         Creates a schema object from a dictionary, if the dictionary contains
-        keys that are not present in the schema object they will be ignored
+        keys that are not present in the schema object they will be ignored.
+        If nested is false the lists of nested objects are left empty.
         """
-        if cls is SchemaObj:
-            raise TypeError("Must be used in a subclass")
+        if cls._variant_key is not None:
+            cls = cls._variants.get(d.get(cls._variant_key), cls)
 
-        fields = [f.name for f in dataclasses.fields(cls)]
-        filtered = {k: v for k, v in d.items() if k in fields}
+        decoders = _decoders.get(cls) or cls._decoder()
+        get = d.get
+        return cls(*[get(name, default) if decode is None else decode(get(name) or ())
+                     for name, default, decode in decoders[0 if nested else 1]])
 
-        return cls(**filtered)
+    @classmethod
+    def _fromlist(cls, items):
+        return [cls._fromdict(d) for d in items] if items else ()
+
+    @staticmethod
+    def _skip(items):
+        return ()
 
 
 @dataclasses.dataclass
@@ -119,40 +880,74 @@ class Course(SchemaObj):
     """
     A course, pretty self explanatory
     https://www.examulator.com/er/output/tables/course.html
+
+    timesynced and incremental are set by MoodleInstance.walk.
     """
+    __slots__ = ("id", "shortname", "fullname", "summary", "startdate", "enddate", "timesynced", "incremental")
+
     id: int
     shortname: str
     fullname: str
     summary: str
     startdate: int
     enddate: int
+    timesynced: Optional[float]
+    incremental: bool
+
+    _defaults = {"shortname": "", "incremental": False}
 
     def get_sections(self, api):
-        req = api.core_course_get_contents(courseid=self.id)
-        for s in req.json():
-            # rest api response does not contain course id
-            s["course"] = self.id
-            yield Section._fromdict(s)
+        req = api.stream("core_course_get_contents", courseid=self.id)
+        if not req:
+            return
+        with req:
+            try:
+                for s in jsonstream.iter_array(req.iter_content(MoodleInstance.stream_chunk_size)):
+                    # rest api response does not contain course id
+                    s["course"] = self.id
+                    yield Section._fromdict(s)
+            except jsonstream.NotAnArray:
+                log.error(f"failed to get contents of course {self.id}")
 
 
 @dataclasses.dataclass
-class Section(SchemaObj):
+class Content(SchemaObj):
     """
-    Sections of a course
-    https://www.examulator.com/er/output/tables/course_sections.html
+    A file or link of a module
+    https://docs.moodle.org/dev/Web_service_API_functions
     """
-    id: int
-    course: int
-    section: int
-    name: str
-    summary: str
-    visible: bool
+    __slots__ = ("type", "filename", "fileurl", "filesize", "timemodified")
 
-    modules: List
+    type: str
+    filename: str
+    fileurl: str
+    filesize: Optional[int]
+    timemodified: Optional[int]
 
-    def get_modules(self):
-        for m in self.modules:
-            yield Module._fromdict(m)
+    _defaults = {"filename": ""}
+    _variant_key = "type"
+
+
+@dataclasses.dataclass
+class File(Content):
+    """ A file, the contents of a resource or of a folder """
+    __slots__ = ("filepath", "mimetype")
+
+    filepath: Optional[str]
+    mimetype: Optional[str]
+
+    _variant_key = None
+
+
+@dataclasses.dataclass
+class ExternalLink(Content):
+    """ The link of a url module, fileurl is the external url """
+    __slots__ = ()
+
+    _variant_key = None
+
+
+Content._variants = {"file": File, "url": ExternalLink}
 
 
 @dataclasses.dataclass
@@ -161,21 +956,81 @@ class Module(SchemaObj):
     Modules of a Course, they are grouped in sections
     https://www.examulator.com/er/output/tables/course_modules.html
     """
+    __slots__ = ("id", "name", "modname", "url", "description", "contents")
+
     id: int
     name: str
+    modname: str
+    url: Optional[str]
+    description: Optional[str]
+    contents: List[Content]
+
+    _defaults = {"name": ""}
+    _variant_key = "modname"
 
 
 @dataclasses.dataclass
-class File(SchemaObj):
-    filename: str
-    fileurl: str
+class Folder(Module):
+    """ A folder module, its contents are files in a tree of directories """
+    __slots__ = ()
 
+    _variant_key = None
 
-@dataclasses.dataclass
-class Folder(SchemaObj):
-    pass
+    def files(self):
+        """ Yields tuples (directory, file), directory is relative to the folder """
+        for content in self.contents:
+            if isinstance(content, File):
+                yield (content.filepath or "/").strip("/"), content
+
+
+Module._variants = {"folder": Folder}
 
 
 @dataclasses.dataclass
-class ExternalLink(SchemaObj):
-    pass
+class Section(SchemaObj):
+    """
+    Sections of a course
+    https://www.examulator.com/er/output/tables/course_sections.html
+    """
+    __slots__ = ("id", "course", "section", "name", "summary", "visible", "modules")
+
+    id: int
+    course: Optional[int]
+    section: int
+    name: str
+    summary: Optional[str]
+    visible: Optional[bool]
+    modules: List[Module]
+
+    _defaults = {"name": ""}
+
+    def get_modules(self):
+        yield from self.modules
+
+
+# schema class of the items of MoodleInstance.walk
+schema = {
+    Kind.COURSE: Course,
+    Kind.SECTION: Section,
+    Kind.MODULE: Module,
+    Kind.CONTENT: Content,
+}
+
+
+def typed(items):
+    """
+    Decodes the (Kind, dict) tuples yielded by MoodleInstance.walk (or
+    Catalog.walk) into (Kind, SchemaObj) tuples. The children of an item
+    are yielded after it, so they are not decoded twice: the sections are
+    decoded without their modules and the modules without their contents.
+    """
+    decoders = {kind: cls._fromdict for kind, cls in schema.items()}
+    if not trace.enabled():
+        for kind, item in items:
+            yield kind, decoders[kind](item, False)
+        return
+
+    for kind, item in items:
+        with trace.span("decode item", kind=kind.value):
+            decoded = decoders[kind](item, False)
+        yield kind, decoded
@@ -0,0 +1,135 @@
+import time
+import random
+import logging
+import threading
+import email.utils
+
+log = logging.getLogger("muddle.retry")
+
+
+class RetryPolicy:
+    """
+    Decides which failed calls are retried and how long to wait before
+    retrying them: exponential backoff with full jitter, so that many
+    threads that failed at the same time do not retry at the same time
+    """
+
+    # too many requests and the errors of overloaded servers / proxies
+    default_statuses = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, retries=3, backoff=0.5, backoff_max=30, statuses=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.statuses = frozenset(statuses) if statuses is not None else RetryPolicy.default_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Returns the number of seconds to wait after the given (0-based)
+        attempt failed. retry_after is the delay asked for by the server.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    @staticmethod
+    def retry_after(response):
+        """ Returns the Retry-After header of response in seconds, or None """
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+
+        if value.strip().isdigit():
+            return int(value)
+
+        try:
+            return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class TokenBucket:
+    """
+    Limits the rate of calls: every call takes a token, tokens are added
+    at rate per second up to burst. Calls wait until a token is available.
+    """
+
+    def __init__(self, rate, burst=10, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.sleep = sleep
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def acquire(self):
+        """ Takes a token, waits until there is one """
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            self.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a server that keeps failing: after threshold failures in
+    a row the circuit opens and calls fail immediately for reset_timeout
+    seconds. Then a single trial call is let through, the circuit closes
+    again if it succeeds and stays open for another reset_timeout otherwise.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self.state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._opened = 0
+
+    def allow(self):
+        """ Returns true if a call may be made """
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return True
+
+            if self.state == CircuitBreaker.OPEN and self.clock() - self._opened >= self.reset_timeout:
+                # let one call through to see if the server is back
+                self.state = CircuitBreaker.HALF_OPEN
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CircuitBreaker.CLOSED:
+                log.info("circuit closed, the server answers again")
+            self.state = CircuitBreaker.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or (
+                    self.state == CircuitBreaker.CLOSED and self.threshold and self._failures >= self.threshold):
+                log.warning(f"circuit open after {self._failures} failures, "
+                            f"not calling the server for {self.reset_timeout}s")
+                self.state = CircuitBreaker.OPEN
+                self._opened = self.clock()
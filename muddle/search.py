@@ -0,0 +1,103 @@
+import re
+
+
+class TitleIndex:
+    """
+    Inverted index of the titles of the items of the tree, to search them
+    without looking at every item
+
+    Titles are split into lowercase tokens. A query matches an item if every
+    word of the query is contained in one of the tokens of its title. The
+    tokens that contain a word are found with an index of their trigrams,
+    so only the (few) distinct tokens have to be compared and not the items.
+    """
+
+    tokenizer = re.compile(r"\w+")
+
+    def __init__(self):
+        # item -> tokens of its title
+        self.items = {}
+        # token -> items with the token in the title
+        self.postings = {}
+        # trigram -> tokens containing the trigram
+        self.trigrams = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    @staticmethod
+    def tokens(text):
+        return set(TitleIndex.tokenizer.findall(text.lower()))
+
+    @staticmethod
+    def trigrams_of(token):
+        return (token[i:i + 3] for i in range(len(token) - 2))
+
+    def add(self, item, title):
+        """ Indexes (or reindexes) item under title """
+        if item in self.items:
+            self.remove(item)
+
+        tokens = TitleIndex.tokens(title)
+        self.items[item] = tokens
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = set()
+                for trigram in TitleIndex.trigrams_of(token):
+                    self.trigrams.setdefault(trigram, set()).add(token)
+            postings.add(item)
+
+    def remove(self, item):
+        for token in self.items.pop(item, ()):
+            postings = self.postings[token]
+            postings.discard(item)
+            if postings:
+                continue
+
+            del self.postings[token]
+            for trigram in TitleIndex.trigrams_of(token):
+                tokens = self.trigrams[trigram]
+                tokens.discard(token)
+                if not tokens:
+                    del self.trigrams[trigram]
+
+    def clear(self):
+        self.items.clear()
+        self.postings.clear()
+        self.trigrams.clear()
+
+    def matching_tokens(self, word):
+        """ Returns the tokens that contain word """
+        if len(word) < 3:
+            candidates = self.postings.keys()
+        else:
+            sets = [self.trigrams.get(trigram) for trigram in TitleIndex.trigrams_of(word)]
+            if not all(sets):
+                return []
+            sets.sort(key=len)
+            candidates = sets[0].intersection(*sets[1:])
+
+        return [token for token in candidates if word in token]
+
+    def search(self, query):
+        """
+        Returns the set of items that match every word of query, or None if
+        the query does not contain any word
+        """
+        words = TitleIndex.tokens(query)
+        if not words:
+            return None
+
+        result = None
+        # long words have fewer matches
+        for word in sorted(words, key=len, reverse=True):
+            items = set()
+            for token in self.matching_tokens(word):
+                items.update(self.postings[token])
+
+            result = items if result is None else result & items
+            if not result:
+                break
+
+        return result
@@ -0,0 +1,181 @@
+import os
+import json
+import html
+import fnmatch
+import logging
+import pathlib
+import threading
+
+from . import download
+from .moodle import Kind
+
+log = logging.getLogger("muddle.sync")
+
+
+class Manifest:
+    """
+    Records the files of a download directory and the version of moodle
+    they were downloaded from (fileurl, filesize and timemodified), so that
+    files that did not change can be skipped without sending any request.
+    It is stored in the directory itself.
+    """
+
+    filename = ".muddle-sync.json"
+    version = 1
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self.path = self.root.joinpath(Manifest.filename)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def key(self, path):
+        """ Paths are stored relative to the root, so that it can be moved """
+        path = pathlib.Path(path)
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning(f"could not read sync manifest {self.path}, downloading everything: {e}")
+            return
+
+        if data.get("version") == Manifest.version:
+            self.entries = data["files"]
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"version": Manifest.version, "files": self.entries}, indent=1)
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning(f"could not write sync manifest {self.path}: {e}")
+
+    def is_current(self, job):
+        """
+        Returns true if the local file of job was downloaded from the same
+        version of the file on moodle and was not removed or truncated since
+        """
+        # without a modification time changes cannot be detected
+        if job.timemodified is None:
+            return False
+
+        with self._lock:
+            entry = self.entries.get(self.key(job.path))
+
+        if entry != {"fileurl": job.url, "filesize": job.size, "timemodified": job.timemodified}:
+            return False
+
+        try:
+            size = os.stat(job.path).st_size
+        except OSError:
+            return False
+
+        return job.size is None or size == job.size
+
+    def record(self, job):
+        """ Marks job as downloaded """
+        with self._lock:
+            self.entries[self.key(job.path)] = {
+                "fileurl": job.url,
+                "filesize": job.size,
+                "timemodified": job.timemodified,
+            }
+
+    def outdated(self, jobs):
+        """ Returns the jobs whose files are missing or changed on moodle """
+        return [job for job in jobs if not self.is_current(job)]
+
+
+def collect_jobs(root, items):
+    """
+    Yields a download.Download for every file in items, the (Kind, dict)
+    tuples of MoodleInstance.walk. The files are placed in root with the
+    same course/section/module layout as in the tree of the GUI.
+    """
+    titles = []
+    depth = {Kind.COURSE: 0, Kind.SECTION: 1, Kind.MODULE: 2}
+
+    for kind, item in items:
+        if kind == Kind.COURSE:
+            titles[:] = [html.unescape(item["shortname"])]
+        elif kind in depth:
+            del titles[depth[kind]:]
+            titles.append(html.unescape(item["name"]))
+        elif kind == Kind.CONTENT and item.get("type") == "file":
+            yield download.Download(
+                url=item["fileurl"],
+                # files of folders can have the same name in different directories
+                path=download.local_path(root, *titles, *download.filepath_parts(item.get("filepath")),
+                                         html.unescape(item["filename"])),
+                size=item.get("filesize"),
+                timemodified=item.get("timemodified"))
+
+
+def filter_courses(courses, patterns):
+    """
+    Returns the courses whose id, short name or full name match one of the
+    glob patterns (case insensitive)
+    """
+    patterns = [p.lower() for p in patterns]
+    return [course for course in courses
+            if any(fnmatch.fnmatchcase(str(course.get(field, "")).lower(), p)
+                   for field in ("id", "shortname", "fullname")
+                   for p in patterns)]
+
+
+def filter_jobs(jobs, root, include=None, exclude=None):
+    """
+    Yields the jobs whose path relative to root matches one of the include
+    glob patterns (if any) and none of the exclude patterns
+    """
+    root = pathlib.Path(root)
+    for job in jobs:
+        path = job.path.relative_to(root).as_posix()
+        if include and not any(fnmatch.fnmatchcase(path, p) for p in include):
+            continue
+        if exclude and any(fnmatch.fnmatchcase(path, p) for p in exclude):
+            continue
+        yield job
+
+
+def mirror(downloader, manifest, jobs, on_bytes=None, on_done=None, on_start=None):
+    """
+    Downloads the jobs that are not current according to manifest and
+    records the successful ones. Returns a tuple (failed, skipped) of lists
+    of jobs. on_start(outdated, skipped) is called before the downloads
+    start.
+    """
+    jobs = list(jobs)
+    outdated = manifest.outdated(jobs)
+    outdated_ids = set(map(id, outdated))
+    skipped = [job for job in jobs if id(job) not in outdated_ids]
+    log.info(f"{len(outdated)} files changed, {len(skipped)} are up to date")
+
+    if on_start:
+        on_start(outdated, skipped)
+
+    def done(job, error):
+        if error is None:
+            manifest.record(job)
+        if on_done:
+            on_done(job, error)
+
+    try:
+        failed = downloader.download(outdated, on_bytes, done)
+    finally:
+        manifest.save()
+
+    return failed, skipped
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+
+log = logging.getLogger("muddle.trace")
+
+# events recorded since start(), None while tracing is off
+_events = None
+_threads = {}
+
+
+class _NullSpan:
+    """ Returned by span() while tracing is off, does nothing """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Span:
+    """ A named interval on the current thread, with optional arguments """
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        events = _events
+        if events is None:
+            return False
+
+        tid = threading.get_ident()
+        if tid not in _threads:
+            _threads[tid] = threading.current_thread().name
+
+        # chrome trace "complete" event, times in microseconds
+        events.append({"name": self.name, "ph": "X", "ts": self.start * 1e6, "dur": (end - self.start) * 1e6,
+                       "pid": os.getpid(), "tid": tid, "args": self.args})
+        return False
+
+    def set(self, **args):
+        """ Adds arguments known only at the end of the span (e.g. a size) """
+        self.args.update(args)
+
+
+def span(name, **args):
+    """
+    Returns a context manager that records the time spent in the with block
+    as a span, or a shared object that does nothing if tracing is off
+    """
+    if _events is None:
+        return _null_span
+    return Span(name, args)
+
+
+def traced(name=None):
+    """ Decorator that records every call of the function as a span """
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _events is None:
+                return func(*args, **kwargs)
+            with Span(label, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def enabled():
+    return _events is not None
+
+
+def thread_name(name):
+    """ Names the current thread in the trace (QThreads are all called Dummy-N) """
+    _threads[threading.get_ident()] = name
+
+
+def start():
+    global _events
+    _events = []
+
+
+def stop():
+    """ Stops tracing and returns the recorded events """
+    global _events
+    events, _events = _events or [], None
+    return events
+
+
+def save(path):
+    """ Stops tracing and writes the events as Chrome / Perfetto trace JSON """
+    events = stop()
+    pid = os.getpid()
+    metadata = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                for tid, name in _threads.items()]
+
+    try:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+    except OSError as e:
+        log.error(f"could not write the trace to {path}: {e}")
+        return
+
+    log.info(f"wrote {len(events)} spans to {path}")
@@ -0,0 +1,183 @@
+# Form implementation generated from reading ui file 'muddle/muddle.ui'
+#
+# Created by: PyQt6 UI code generator 6.11.0
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic6 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt6 import QtCore, QtGui, QtWidgets
+
+
+class Ui_MuddleWindow(object):
+    def setupUi(self, MuddleWindow):
+        MuddleWindow.setObjectName("MuddleWindow")
+        MuddleWindow.resize(600, 750)
+        self.Muddle = QtWidgets.QTabWidget(parent=MuddleWindow)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Policy.Maximum, QtWidgets.QSizePolicy.Policy.Maximum)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.Muddle.sizePolicy().hasHeightForWidth())
+        self.Muddle.setSizePolicy(sizePolicy)
+        self.Muddle.setMinimumSize(QtCore.QSize(400, 600))
+        self.Muddle.setObjectName("Muddle")
+        self.moodleTab = QtWidgets.QWidget()
+        self.moodleTab.setObjectName("moodleTab")
+        self.gridLayout = QtWidgets.QGridLayout(self.moodleTab)
+        self.gridLayout.setObjectName("gridLayout")
+        self.downloadPathEdit = QtWidgets.QLineEdit(parent=self.moodleTab)
+        self.downloadPathEdit.setEnabled(True)
+        self.downloadPathEdit.setObjectName("downloadPathEdit")
+        self.gridLayout.addWidget(self.downloadPathEdit, 2, 0, 1, 1)
+        self.downloadBtn = QtWidgets.QPushButton(parent=self.moodleTab)
+        self.downloadBtn.setEnabled(False)
+        self.downloadBtn.setObjectName("downloadBtn")
+        self.gridLayout.addWidget(self.downloadBtn, 4, 0, 1, 2)
+        self.searchBar = QtWidgets.QLineEdit(parent=self.moodleTab)
+        self.searchBar.setEnabled(True)
+        self.searchBar.setInputMask("")
+        self.searchBar.setClearButtonEnabled(True)
+        self.searchBar.setObjectName("searchBar")
+        self.gridLayout.addWidget(self.searchBar, 0, 0, 1, 1)
+        self.downloadProgressBar = QtWidgets.QProgressBar(parent=self.moodleTab)
+        self.downloadProgressBar.setEnabled(True)
+        self.downloadProgressBar.setProperty("value", 0)
+        self.downloadProgressBar.setObjectName("downloadProgressBar")
+        self.gridLayout.addWidget(self.downloadProgressBar, 5, 0, 1, 2)
+        self.refreshBtn = QtWidgets.QPushButton(parent=self.moodleTab)
+        self.refreshBtn.setObjectName("refreshBtn")
+        self.gridLayout.addWidget(self.refreshBtn, 0, 1, 1, 1)
+        self.selectPathBtn = QtWidgets.QPushButton(parent=self.moodleTab)
+        self.selectPathBtn.setEnabled(True)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.selectPathBtn.sizePolicy().hasHeightForWidth())
+        self.selectPathBtn.setSizePolicy(sizePolicy)
+        self.selectPathBtn.setObjectName("selectPathBtn")
+        self.gridLayout.addWidget(self.selectPathBtn, 2, 1, 1, 1)
+        self.moodleTree = QtWidgets.QTreeView(parent=self.moodleTab)
+        self.moodleTree.setHeaderHidden(False)
+        self.moodleTree.setObjectName("moodleTree")
+        self.gridLayout.addWidget(self.moodleTree, 1, 0, 1, 2)
+        self.Muddle.addTab(self.moodleTab, "")
+        self.localTab = QtWidgets.QTreeView()
+        self.localTab.setObjectName("localTab")
+        self.Muddle.addTab(self.localTab, "")
+        self.logsTab = QtWidgets.QPlainTextEdit()
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Expanding)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.logsTab.sizePolicy().hasHeightForWidth())
+        self.logsTab.setSizePolicy(sizePolicy)
+        self.logsTab.setFrameShadow(QtWidgets.QFrame.Shadow.Sunken)
+        self.logsTab.setUndoRedoEnabled(False)
+        self.logsTab.setPlainText("")
+        self.logsTab.setTextInteractionFlags(QtCore.Qt.TextInteractionFlag.TextSelectableByKeyboard|QtCore.Qt.TextInteractionFlag.TextSelectableByMouse)
+        self.logsTab.setObjectName("logsTab")
+        self.Muddle.addTab(self.logsTab, "")
+        self.statsTab = QtWidgets.QTreeWidget()
+        self.statsTab.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.statsTab.setUniformRowHeights(True)
+        self.statsTab.setObjectName("statsTab")
+        self.Muddle.addTab(self.statsTab, "")
+        self.settingsTab = QtWidgets.QWidget()
+        self.settingsTab.setObjectName("settingsTab")
+        self.verticalLayout = QtWidgets.QVBoxLayout(self.settingsTab)
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.moodleGrp = QtWidgets.QGroupBox(parent=self.settingsTab)
+        self.moodleGrp.setObjectName("moodleGrp")
+        self.gridLayout_3 = QtWidgets.QGridLayout(self.moodleGrp)
+        self.gridLayout_3.setObjectName("gridLayout_3")
+        self.intanceLabel = QtWidgets.QLabel(parent=self.moodleGrp)
+        self.intanceLabel.setObjectName("intanceLabel")
+        self.gridLayout_3.addWidget(self.intanceLabel, 0, 0, 1, 1)
+        self.tokenLabel = QtWidgets.QLabel(parent=self.moodleGrp)
+        self.tokenLabel.setObjectName("tokenLabel")
+        self.gridLayout_3.addWidget(self.tokenLabel, 1, 0, 1, 1)
+        self.instanceUrlEdit = QtWidgets.QLineEdit(parent=self.moodleGrp)
+        self.instanceUrlEdit.setClearButtonEnabled(True)
+        self.instanceUrlEdit.setObjectName("instanceUrlEdit")
+        self.gridLayout_3.addWidget(self.instanceUrlEdit, 0, 1, 1, 1)
+        self.tokenEdit = QtWidgets.QLineEdit(parent=self.moodleGrp)
+        self.tokenEdit.setClearButtonEnabled(True)
+        self.tokenEdit.setObjectName("tokenEdit")
+        self.gridLayout_3.addWidget(self.tokenEdit, 1, 1, 1, 1)
+        self.requestTokenBtn = QtWidgets.QPushButton(parent=self.moodleGrp)
+        self.requestTokenBtn.setEnabled(False)
+        self.requestTokenBtn.setObjectName("requestTokenBtn")
+        self.gridLayout_3.addWidget(self.requestTokenBtn, 1, 2, 1, 1)
+        self.switchLoginBtn = QtWidgets.QPushButton(parent=self.moodleGrp)
+        self.switchLoginBtn.setObjectName("switchLoginBtn")
+        self.gridLayout_3.addWidget(self.switchLoginBtn, 0, 2, 1, 1)
+        self.verticalLayout.addWidget(self.moodleGrp)
+        self.muddleGrp = QtWidgets.QGroupBox(parent=self.settingsTab)
+        self.muddleGrp.setObjectName("muddleGrp")
+        self.gridLayout_4 = QtWidgets.QGridLayout(self.muddleGrp)
+        self.gridLayout_4.setObjectName("gridLayout_4")
+        self.configLabel = QtWidgets.QLabel(parent=self.muddleGrp)
+        self.configLabel.setObjectName("configLabel")
+        self.gridLayout_4.addWidget(self.configLabel, 0, 0, 1, 1)
+        self.configEdit = QtWidgets.QLineEdit(parent=self.muddleGrp)
+        self.configEdit.setReadOnly(True)
+        self.configEdit.setObjectName("configEdit")
+        self.gridLayout_4.addWidget(self.configEdit, 0, 1, 1, 1)
+        self.defaultDownloadPathLabel = QtWidgets.QLabel(parent=self.muddleGrp)
+        self.defaultDownloadPathLabel.setObjectName("defaultDownloadPathLabel")
+        self.gridLayout_4.addWidget(self.defaultDownloadPathLabel, 1, 0, 1, 1)
+        self.defaltDownloadPathEdit = QtWidgets.QLineEdit(parent=self.muddleGrp)
+        self.defaltDownloadPathEdit.setEnabled(False)
+        self.defaltDownloadPathEdit.setClearButtonEnabled(True)
+        self.defaltDownloadPathEdit.setObjectName("defaltDownloadPathEdit")
+        self.gridLayout_4.addWidget(self.defaltDownloadPathEdit, 1, 1, 1, 1)
+        self.alwaysStartGuiCheckBox = QtWidgets.QCheckBox(parent=self.muddleGrp)
+        self.alwaysStartGuiCheckBox.setEnabled(False)
+        self.alwaysStartGuiCheckBox.setObjectName("alwaysStartGuiCheckBox")
+        self.gridLayout_4.addWidget(self.alwaysStartGuiCheckBox, 2, 1, 1, 1)
+        self.verticalLayout.addWidget(self.muddleGrp)
+        spacerItem = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Expanding)
+        self.verticalLayout.addItem(spacerItem)
+        self.Muddle.addTab(self.settingsTab, "")
+        self.menubar = QtWidgets.QMenuBar(parent=MuddleWindow)
+        self.menubar.setGeometry(QtCore.QRect(0, 0, 600, 24))
+        self.menubar.setObjectName("menubar")
+        MuddleWindow.setMenuBar(self.menubar)
+        self.statusbar = QtWidgets.QStatusBar(parent=MuddleWindow)
+        self.statusbar.setObjectName("statusbar")
+        MuddleWindow.setStatusBar(self.statusbar)
+
+        self.retranslateUi(MuddleWindow)
+        self.Muddle.setCurrentIndex(0)
+        QtCore.QMetaObject.connectSlotsByName(MuddleWindow)
+
+    def retranslateUi(self, MuddleWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MuddleWindow.setWindowTitle(_translate("MuddleWindow", "Muddle"))
+        self.Muddle.setWindowTitle(_translate("MuddleWindow", "TabWidget"))
+        self.downloadBtn.setText(_translate("MuddleWindow", "Download"))
+        self.searchBar.setPlaceholderText(_translate("MuddleWindow", "Search"))
+        self.refreshBtn.setText(_translate("MuddleWindow", "Refresh"))
+        self.selectPathBtn.setText(_translate("MuddleWindow", "Select"))
+        self.Muddle.setTabText(self.Muddle.indexOf(self.moodleTab), _translate("MuddleWindow", "Moodle"))
+        self.Muddle.setTabText(self.Muddle.indexOf(self.localTab), _translate("MuddleWindow", "Local"))
+        self.Muddle.setTabText(self.Muddle.indexOf(self.logsTab), _translate("MuddleWindow", "Logs"))
+        self.statsTab.headerItem().setText(0, _translate("MuddleWindow", "Name"))
+        self.statsTab.headerItem().setText(1, _translate("MuddleWindow", "Calls"))
+        self.statsTab.headerItem().setText(2, _translate("MuddleWindow", "Errors"))
+        self.statsTab.headerItem().setText(3, _translate("MuddleWindow", "Cached"))
+        self.statsTab.headerItem().setText(4, _translate("MuddleWindow", "Mean"))
+        self.statsTab.headerItem().setText(5, _translate("MuddleWindow", "p95"))
+        self.statsTab.headerItem().setText(6, _translate("MuddleWindow", "Max"))
+        self.statsTab.headerItem().setText(7, _translate("MuddleWindow", "Received"))
+        self.Muddle.setTabText(self.Muddle.indexOf(self.statsTab), _translate("MuddleWindow", "Stats"))
+        self.moodleGrp.setTitle(_translate("MuddleWindow", "Moodle"))
+        self.intanceLabel.setText(_translate("MuddleWindow", "Instance URL"))
+        self.tokenLabel.setText(_translate("MuddleWindow", "Token"))
+        self.requestTokenBtn.setText(_translate("MuddleWindow", "Request Token"))
+        self.switchLoginBtn.setText(_translate("MuddleWindow", "SWITCH Login"))
+        self.muddleGrp.setTitle(_translate("MuddleWindow", "Muddle"))
+        self.configLabel.setText(_translate("MuddleWindow", "Config"))
+        self.defaultDownloadPathLabel.setText(_translate("MuddleWindow", "Default download path"))
+        self.defaltDownloadPathEdit.setPlaceholderText(_translate("MuddleWindow", "Not set"))
+        self.alwaysStartGuiCheckBox.setText(_translate("MuddleWindow", "Always start GUI"))
+        self.Muddle.setTabText(self.Muddle.indexOf(self.settingsTab), _translate("MuddleWindow", "Settings"))
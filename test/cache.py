@@ -0,0 +1,74 @@
+import pytest
+
+import os
+import time
+
+from muddle import cache
+
+
+@pytest.fixture
+def responses(tmp_path):
+    return cache.ResponseCache(tmp_path, max_size=1024, ttls={"fn": 60})
+
+
+def test_key():
+    key = cache.ResponseCache.key
+    assert key("url", "token", "fn", {"a": 1}) == key("url", "token", "fn", {"a": 1})
+    assert key("url", "token", "fn", {"a": 1}) != key("url", "token", "fn", {"a": 2})
+    # another account
+    assert key("url", "token", "fn", {"a": 1}) != key("url", "other", "fn", {"a": 1})
+
+
+def test_lookup_uses_cache(responses):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return cache.ResponseCache.response("url", b'{"userid": 3}')
+
+    assert responses.lookup("url", "token", "fn", {}, fetch).json() == {"userid": 3}
+    assert responses.lookup("url", "token", "fn", {}, fetch).json() == {"userid": 3}
+    assert len(calls) == 1
+
+    # the response of another account is not used
+    assert responses.lookup("url", "other", "fn", {}, fetch).json() == {"userid": 3}
+    assert len(calls) == 2
+
+
+def test_exceptions_are_not_cached(responses):
+    responses.put("k", "fn", b'{"exception": "moodle_exception"}')
+    assert responses.get("k") is None
+
+
+def test_lru_eviction(responses):
+    body = b'"' + b"x" * 400 + b'"'
+    for age, key in [(30, "a"), (20, "b")]:
+        responses.put(key, "fn", body)
+        # mtime resolution of some filesystems is coarse
+        os.utime(responses._path(key), (time.time() - age, ) * 2)
+
+    # does not fit, the oldest entry has to go
+    responses.put("c", "fn", body)
+    assert responses.get("a") is None
+    assert responses.get("c") is not None
+
+
+def test_preview_cache(tmp_path):
+    previews = cache.PreviewCache(tmp_path, max_size=1000)
+    assert previews.get("url", 1, "a.pdf") is None
+
+    old = previews.path("url", 1, "a.pdf")
+    assert old.name == "a.pdf"
+    # a changed file is a different entry
+    assert previews.path("url", 2, "a.pdf") != old
+
+    for age, timemodified in [(20, 1), (10, 2)]:
+        path = previews.path("url", timemodified, "a.pdf")
+        path.parent.mkdir()
+        path.write_bytes(b"x" * 600)
+        os.utime(path, (time.time() - age, ) * 2)
+
+    # keep is never removed, even if it is the least recently used
+    previews.evict(keep=old)
+    assert previews.get("url", 1, "a.pdf") == old
+    assert previews.get("url", 2, "a.pdf") is None
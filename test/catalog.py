@@ -0,0 +1,76 @@
+import pytest
+
+from muddle import catalog
+from muddle.moodle import Kind
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = catalog.Catalog(tmp_path.joinpath("catalog.sqlite3"))
+    yield store
+    store.close()
+
+
+def content(name, timemodified):
+    return {"type": "file", "filename": name, "filepath": "/", "fileurl": f"https://moodle.invalid/{name}",
+            "filesize": 10, "timemodified": timemodified}
+
+
+COURSE = {"id": 1, "shortname": "ALG"}
+SECTIONS = [
+    {"id": 10, "name": "Week 1", "section": 0, "modules": [
+        {"id": 100, "name": "Slides", "modname": "resource", "contents": [content("a.pdf", 100)]},
+        {"id": 101, "name": "Notes", "modname": "resource", "contents": [content("b.txt", 200)]},
+    ]},
+    {"id": 11, "name": "Week 2", "section": 1, "modules": [
+        {"id": 110, "name": "Exam", "modname": "resource", "contents": [content("c.pdf", 300)]},
+    ]},
+]
+
+
+def test_walk(store):
+    store.store_course(COURSE, SECTIONS)
+    assert [(kind, item.get("name") or item.get("filename") or item.get("shortname")) for kind, item in store.walk()] == [
+        (Kind.COURSE, "ALG"),
+        (Kind.SECTION, "Week 1"),
+        (Kind.MODULE, "Slides"), (Kind.CONTENT, "a.pdf"),
+        (Kind.MODULE, "Notes"), (Kind.CONTENT, "b.txt"),
+        (Kind.SECTION, "Week 2"),
+        (Kind.MODULE, "Exam"), (Kind.CONTENT, "c.pdf"),
+    ]
+
+
+def test_files(store):
+    store.store_course(COURSE, SECTIONS)
+    store.store_course({"id": 2, "shortname": "PHY"}, [
+        {"id": 20, "name": "Week 1", "section": 0, "modules": [
+            {"id": 200, "name": "Slides", "modname": "resource", "contents": [content("d.pdf", 250)]}]}])
+
+    assert [f["title"] for f in store.files(suffix="pdf")] == ["c.pdf", "d.pdf", "a.pdf"]
+    assert [f["title"] for f in store.files(since=220, courses=[1])] == ["c.pdf"]
+    assert store.files(limit=1)[0]["course"] == "ALG"
+
+
+def test_incremental(store):
+    store.store_course(COURSE, SECTIONS)
+    changed = [{"id": 10, "name": "Week 1", "section": 0, "modules": [
+        {"id": 101, "name": "Notes", "modname": "resource", "contents": [content("b2.txt", 400)]}]}]
+    store.store_course(COURSE, changed, incremental=True)
+
+    titles = [item.get("filename") for kind, item in store.walk() if kind == Kind.CONTENT]
+    assert titles == ["a.pdf", "b2.txt", "c.pdf"]
+
+    # a full refresh removes what is not there anymore
+    store.store_course(COURSE, changed)
+    titles = [item.get("filename") for kind, item in store.walk() if kind == Kind.CONTENT]
+    assert titles == ["b2.txt"]
+
+
+def test_unenrolled_courses_are_removed(store):
+    store.store_courses([COURSE, {"id": 2, "shortname": "PHY"}])
+    store.store_course(COURSE, SECTIONS)
+    store.store_course({"id": 2, "shortname": "PHY"}, [])
+
+    store.store_courses([{"id": 2, "shortname": "PHY"}])
+    assert [item["shortname"] for kind, item in store.walk()] == ["PHY"]
+    assert store.files() == []
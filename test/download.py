@@ -0,0 +1,189 @@
+import pytest
+
+import os
+import time
+import threading
+import collections
+import concurrent.futures
+
+from muddle import download
+from muddle import moodle
+
+
+DATA = bytes(range(256)) * 40
+
+
+class FakeStream:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+class FakePool:
+    def __init__(self, ranges=True):
+        self.ranges = ranges
+        self.requested = []
+
+    def post(self, url, data=None, headers=None, stream=False):
+        rng = (headers or {}).get("Range")
+        self.requested.append(rng)
+        if not rng or not self.ranges:
+            return FakeStream(200, DATA)
+
+        start, _, end = rng[len("bytes="):].partition("-")
+        end = int(end) + 1 if end else len(DATA)
+        return FakeStream(206, DATA[int(start):end])
+
+
+@pytest.fixture
+def pool():
+    return FakePool()
+
+
+def helper(pool):
+    return moodle.ApiHelper(moodle.RestApi("https://moodle.invalid", "token", pool))
+
+
+def test_resume(pool, tmp_path):
+    path = tmp_path.joinpath("file.pdf")
+    path.with_name("file.pdf.1000.part").write_bytes(DATA[:3000])
+
+    helper(pool).get_file("url", path, filesize=len(DATA), timemodified=1000)
+    assert pool.requested == ["bytes=3000-"]
+    assert path.read_bytes() == DATA
+    assert os.stat(path).st_mtime == 1000
+    assert os.listdir(tmp_path) == ["file.pdf"]
+
+
+def test_outdated_part_is_not_resumed(pool, tmp_path):
+    path = tmp_path.joinpath("file.pdf")
+    path.with_name("file.pdf.999.part").write_bytes(b"old")
+
+    helper(pool).get_file("url", path, filesize=len(DATA), timemodified=1000)
+    assert pool.requested == [None]
+    assert path.read_bytes() == DATA
+
+
+def test_server_without_ranges(tmp_path):
+    pool = FakePool(ranges=False)
+    path = tmp_path.joinpath("file.pdf")
+    path.with_name("file.pdf.0.part").write_bytes(DATA[:3000])
+
+    received = []
+    helper(pool).get_file("url", path, progress=received.append, segments=4, segment_threshold=0)
+    assert path.read_bytes() == DATA
+    assert sum(received) == len(DATA)
+
+
+def test_segments(pool, tmp_path):
+    path = tmp_path.joinpath("file.pdf")
+    helper(pool).get_file("url", path, filesize=len(DATA), segments=4, segment_threshold=0)
+    assert len(pool.requested) == 4
+    assert path.read_bytes() == DATA
+
+
+def test_size_mismatch(pool, tmp_path):
+    path = tmp_path.joinpath("file.pdf")
+    with pytest.raises(IOError):
+        helper(pool).get_file("url", path, filesize=len(DATA) + 1)
+    assert not path.exists()
+
+
+def test_parts_of_other_files_are_kept(pool, tmp_path):
+    path = tmp_path.joinpath("slides.pdf")
+    # being downloaded at the same time
+    other = tmp_path.joinpath("slides.pdf.zip.1000.part")
+    other.write_bytes(b"zip")
+
+    helper(pool).get_file("url", path, filesize=len(DATA), timemodified=1000)
+    assert other.read_bytes() == b"zip"
+
+
+def test_bad_part_is_not_resumed(pool, tmp_path):
+    path = tmp_path.joinpath("file.pdf")
+    # larger than the file, e.g. written by a server that ignored a range
+    path.with_name("file.pdf.1000.part").write_bytes(DATA + DATA[:10])
+
+    with pytest.raises(IOError):
+        helper(pool).get_file("url", path, filesize=len(DATA), timemodified=1000)
+    assert os.listdir(tmp_path) == []
+
+    helper(pool).get_file("url", path, filesize=len(DATA), timemodified=1000)
+    assert path.read_bytes() == DATA
+
+
+class SlowPool(FakePool):
+    """ Counts the downloads running at the same time from each host, fails those of the urls in failing """
+    def __init__(self, failing=()):
+        super().__init__()
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+        self.running = collections.Counter()
+        self.most = collections.Counter()
+
+    def post(self, url, data=None, headers=None, stream=False):
+        host = url.split("/")[2]
+        with self.lock:
+            self.running[host] += 1
+            self.most[host] = max(self.most[host], self.running[host])
+        try:
+            time.sleep(0.01)
+            if url in self.failing:
+                raise IOError("connection reset")
+            return super().post(url, data, headers, stream)
+        finally:
+            with self.lock:
+                self.running[host] -= 1
+
+
+def jobs(tmp_path, hosts, files):
+    return [download.Download(f"https://{host}/{n}.pdf", tmp_path.joinpath(host, f"{n}.pdf"), len(DATA))
+            for host in hosts for n in range(files)]
+
+
+def test_downloader_per_host(tmp_path):
+    pool = SlowPool()
+    downloader = download.Downloader(helper(pool), max_workers=8, per_host=2)
+
+    assert downloader.download(jobs(tmp_path, ["a.invalid", "b.invalid"], 8)) == []
+    assert pool.most == {"a.invalid": 2, "b.invalid": 2}
+    assert all(path.read_bytes() == DATA for path in tmp_path.glob("*/*.pdf"))
+
+
+def test_downloader_failures(tmp_path):
+    todo = jobs(tmp_path, ["a.invalid"], 6)
+    pool = SlowPool(failing=[todo[1].url, todo[4].url])
+    done = []
+
+    failed = download.Downloader(helper(pool), max_workers=2).download(todo, on_done=lambda job, e: done.append(e))
+    # the other files are still downloaded
+    assert sorted(failed, key=todo.index) == [todo[1], todo[4]]
+    assert sorted(os.listdir(tmp_path.joinpath("a.invalid"))) == ["0.pdf", "2.pdf", "3.pdf", "5.pdf"]
+    assert len(done) == 6 and sum(e is not None for e in done) == 2
+
+
+def test_downloader_cancel(tmp_path):
+    todo = jobs(tmp_path, ["a.invalid"], 5)
+    pool = SlowPool()
+    downloader = download.Downloader(helper(pool), max_workers=1)
+    errors = {}
+
+    # cancelled while the first file is being received
+    failed = downloader.download(todo, on_bytes=lambda job, n: downloader.cancel(),
+                                 on_done=lambda job, e: errors.update({job.url: e}))
+    assert sorted(failed, key=todo.index) == todo[1:]
+    assert len(pool.requested) == 1 and errors[todo[0].url] is None
+    assert all(isinstance(errors[job.url], concurrent.futures.CancelledError) for job in todo[1:])
@@ -0,0 +1,58 @@
+import pytest
+
+from muddle import download
+from muddle import fulltext
+from muddle.moodle import Kind
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = fulltext.FullTextIndex(tmp_path.joinpath("fulltext.sqlite3"))
+    yield index
+    index.close()
+
+
+ITEMS = [
+    (Kind.COURSE, {"id": 1, "shortname": "ALG", "fullname": "Algebra", "summary": "<p>Vectors &amp; matrices</p>"}),
+    (Kind.SECTION, {"id": 2, "name": "Week 1", "summary": ""}),
+    (Kind.MODULE, {"id": 3, "name": "Notes", "description": "About <b>eigenvalues</b>"}),
+]
+
+
+def test_strip_html():
+    assert fulltext.strip_html("<p>a &amp; b</p><p>c</p>") == "a & b\n c"
+
+
+def test_items(index):
+    index.add_items(ITEMS)
+    assert [r["key"] for r in index.search("eigen")] == ["module:3"]
+    assert index.search("vectors matrices")[0]["course"] == "ALG"
+    # sections without summary are not indexed
+    assert index.search("week") == []
+
+    # the description was removed
+    index.add_items(ITEMS[:2] + [(Kind.MODULE, {"id": 3, "name": "Notes"})])
+    assert index.search("eigen") == []
+
+
+def test_lazy_course_keeps_summary(index):
+    index.add_items(ITEMS)
+    index.add_items([(Kind.COURSE, {"id": 1, "shortname": "ALG"})])
+    assert len(index.search("vectors")) == 1
+
+
+def test_file(index, tmp_path):
+    path = tmp_path.joinpath("notes.txt")
+    path.write_text("Fourier transforms")
+    job = download.Download("https://moodle.invalid/notes.txt", path)
+
+    index.add_file(job)
+    [result] = index.search("fourier")
+    assert result["key"] == fulltext.key(Kind.CONTENT, job.url)
+    assert result["location"] == str(path)
+    assert "[Fourier]" in result["snippet"]
+
+    path.write_text("Laplace transforms")
+    index.add_file(job)
+    assert index.search("fourier") == []
+    assert len(index.search("transforms")) == 1
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import Qt  # noqa: E402
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+from muddle import gui  # noqa: E402
+from muddle.gui import MoodleItem  # noqa: E402
+
+Checked, Unchecked, PartiallyChecked = Qt.CheckState.Checked, Qt.CheckState.Unchecked, Qt.CheckState.PartiallyChecked
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def model(app):
+    return gui.MoodleTreeModel()
+
+
+def course(sections=2, modules=2, files=2):
+    """ A detached course, every module has some files and an url without check box """
+    item = MoodleItem(MoodleItem.Type.COURSE, 1, "ALG")
+    for s in range(sections):
+        section = MoodleItem(MoodleItem.Type.SECTION, 10 + s, f"Week {s}")
+        item.appendChild(section)
+        for m in range(modules):
+            module = MoodleItem(MoodleItem.Type.RESOURCE, 100 + 10 * s + m, f"Slides {m}")
+            section.appendChild(module)
+            for f in range(files):
+                module.appendChild(MoodleItem(MoodleItem.Type.FILE, title=f"{f}.pdf", url=f"https://moodle.invalid/{s}/{m}/{f}"))
+            module.appendChild(MoodleItem(MoodleItem.Type.URL, title="Wiki", url=f"https://wiki.invalid/{s}/{m}"))
+    return item
+
+
+def states(item):
+    """ The check states of item and its checkable descendants, in the order of the tree """
+    result = [item.checkState] if item.type in gui.MoodleTreeModel.checkableTypes else []
+    for child in item.children:
+        result += states(child)
+    return result
+
+
+def test_check_propagation(model):
+    model.appendItems(model.root, [course()])
+    item = model.root.children[0]
+    section, module = item.children[1], item.children[1].children[0]
+
+    model.setCheckState(module.children[0], Checked)
+    assert (item.checkState, section.checkState, module.checkState) == (PartiallyChecked, ) * 3
+
+    model.setCheckState(module.children[1], Checked)
+    assert (item.checkState, section.checkState, module.checkState) == (PartiallyChecked, PartiallyChecked, Checked)
+
+    model.setCheckState(section, Checked)
+    assert states(section) == [Checked] * 7
+    assert item.checkState == PartiallyChecked
+
+    model.setCheckState(item, Unchecked)
+    assert states(item) == [Unchecked] * 15
+
+
+def test_check_before_load(model):
+    # lazy loading, the course is checked before its contents are fetched
+    model.appendItems(model.root, [MoodleItem(MoodleItem.Type.COURSE, 1, "ALG")])
+    item = model.root.children[0]
+    model.setCheckState(item, Checked)
+
+    model.mergeItem(item, course())
+    assert states(item) == [Checked] * 15
+
+
+def test_check_merged_items(model):
+    model.appendItems(model.root, [course(modules=1)])
+    item = model.root.children[0]
+    model.setCheckState(item.children[0], Checked)
+    model.setCheckState(item.children[1].children[0].children[0], Checked)
+
+    # a module is added to both sections
+    model.mergeItem(item, course(modules=2))
+    first, second = item.children
+    assert states(first) == [Checked] * 7
+    # the state of a partially checked section depends on its new module
+    assert states(second) == [PartiallyChecked, PartiallyChecked, Checked, Unchecked, Unchecked, Unchecked, Unchecked]
+    assert item.checkState == PartiallyChecked
+
+    # the unchecked module is removed, the rest is checked
+    new = course(modules=2)
+    new.children[1].children[0].children.pop()
+    new.children[1].children[0].children.pop(1)
+    new.children[1].children.pop()
+    model.mergeItem(item, new)
+    assert states(second) == [Checked] * 3
+    assert item.checkState == Checked
+
+
+def test_check_signals(model):
+    model.appendItems(model.root, [course(sections=2, modules=10)])
+    item = model.root.children[0]
+    changed, repaints = [], []
+    model.dataChanged.connect(lambda first, last, roles: changed.append((first.internalPointer(), last.internalPointer())))
+    model.checkStatesChanged.connect(lambda: repaints.append(True))
+
+    # one signal for the rows of each parent
+    section = item.children[0]
+    model.setCheckState(section, Checked)
+    assert changed == [(section, section), (section.children[0], section.children[-1])] + [
+        (m.children[0], m.children[1]) for m in section.children] + [(item, item)]
+    assert not repaints
+
+    # the descendants are under too many parents, the views repaint instead
+    changed.clear()
+    model.maxCheckSignals = 8
+    model.setCheckState(item, Unchecked)
+    assert changed == [(item, item)] and repaints == [True]
+    assert states(item) == [Unchecked] * 63
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from muddle import jsonstream
+
+
+DOCUMENTS = [
+    [],
+    [1, 'a,]"b', None, True, False, 2.5e3, -7, {"x": "}{[", "y": [1, [2]]}, [], {}],
+    [{"name": "é ü \\ \"quoted\"", "modules": [{"id": 1, "contents": []}]}],
+]
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1 << 20])
+def test_iter_array(document, size):
+    data = json.dumps(document, ensure_ascii=False, indent=1).encode()
+    assert list(jsonstream.iter_array(chunked(data, size))) == document
+
+
+def test_iter_array_is_lazy():
+    def chunks():
+        yield b'[{"id": 1}, {"id": '
+        # the first element must be out before the rest is read
+        assert seen == [{"id": 1}]
+        yield b'2}]'
+
+    seen = []
+    for value in jsonstream.iter_array(chunks()):
+        seen.append(value)
+    assert seen == [{"id": 1}, {"id": 2}]
+
+
+def test_not_an_array():
+    with pytest.raises(jsonstream.NotAnArray) as e:
+        list(jsonstream.iter_array([b' {"exception": "moodle_exception",', b' "errorcode": "nopermissions"}']))
+    assert e.value.value["errorcode"] == "nopermissions"
+
+
+@pytest.mark.parametrize("data", [b"", b'[{"id": 1}, {"id"', b"[1, 2", b"[1 x]"])
+def test_malformed(data):
+    with pytest.raises(ValueError):
+        list(jsonstream.iter_array(chunked(data, 4)))
@@ -0,0 +1,34 @@
+import pytest
+
+from muddle import metrics
+
+
+def test_histogram():
+    histogram = metrics.Histogram()
+    for seconds in [0.005] * 90 + [3] * 10:
+        histogram.add(seconds)
+
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.95) == 3
+    assert histogram.todict()["mean"] == pytest.approx(0.3045)
+
+
+def test_stats(tmp_path):
+    registry = metrics.Metrics()
+    registry.record_call("core_course_get_contents", 0.2, 1000)
+    registry.record_call("core_course_get_contents", 0.4, 0, error=True)
+    registry.record_cached("core_course_get_contents")
+    registry.record_download(4096, 2)
+    with registry.timed("decode"):
+        pass
+
+    stats = registry.stats()
+    contents = stats["functions"]["core_course_get_contents"]
+    assert (contents["calls"], contents["errors"], contents["cached"], contents["bytes"]) == (2, 1, 1, 1000)
+    assert contents["latency"]["max"] == 0.4
+    assert stats["downloads"]["throughput"] == 2048
+    assert stats["stages"]["decode"]["count"] == 1
+
+    registry.dump(tmp_path.joinpath("stats.json"))
+    assert tmp_path.joinpath("stats.json").exists()
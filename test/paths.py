@@ -6,4 +6,5 @@ def test_defaults():
 	assert paths.default_log_dir != None
 	assert paths.default_log_file != None
 	assert paths.default_config_dir != None
-	assert paths.default_config_file != None
\ No newline at end of file
+	assert paths.default_config_file != None
+	assert paths.default_cache_dir != None
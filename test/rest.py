@@ -0,0 +1,207 @@
+import json
+import time
+import threading
+import http.server
+
+import requests
+
+from muddle import cache
+from muddle import moodle
+from muddle import retry
+
+
+def test_encode_params():
+    params = {
+        "courseid": 3,
+        "courseids": [1, 2],
+        "options": [{"name": "cmid", "value": 4}],
+        "flag": True,
+    }
+
+    assert moodle.encode_params(params) == {
+        "courseid": 3,
+        "courseids[0]": 1,
+        "courseids[1]": 2,
+        "options[0][name]": "cmid",
+        "options[0][value]": 4,
+        "flag": 1,
+    }
+
+
+class FakeHttpResponse:
+    def __init__(self, status_code, content=b"[]"):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def __bool__(self):
+        return self.ok
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakePool(moodle.HttpPool):
+    def __init__(self, responses, **kwargs):
+        super().__init__(retry_policy=retry.RetryPolicy(retries=2, backoff=0), **kwargs)
+        self.responses = list(responses)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_post_retries():
+    pool = FakePool([requests.ConnectionError("refused"), FakeHttpResponse(503), FakeHttpResponse(200)])
+    api = moodle.RestApi("https://moodle.invalid", "token", pool)
+
+    assert api.core_webservice_get_site_info().json() == []
+    assert pool.calls == 3
+
+    pool.responses = [requests.Timeout("slow")] * 3
+    assert api.core_webservice_get_site_info() is None
+
+    # not retried
+    pool.responses = [FakeHttpResponse(403)]
+    assert api.core_webservice_get_site_info() is None
+
+
+def test_post_moodle_exception():
+    error = b'{"exception":"moodle_exception","errorcode":"invalidtoken","message":"Invalid token"}'
+    pool = FakePool([FakeHttpResponse(200, error)])
+    api = moodle.RestApi("https://moodle.invalid", "token", pool)
+
+    assert api.core_webservice_get_site_info() is None
+    assert pool.calls == 1
+
+
+def test_post_circuit_breaker():
+    pool = FakePool([FakeHttpResponse(502)] * 3, breaker_threshold=3, breaker_timeout=60)
+    api = moodle.RestApi("https://moodle.invalid", "token", pool)
+
+    assert api.core_webservice_get_site_info() is None
+    # the circuit is open, the server is not called anymore
+    assert api.core_webservice_get_site_info() is None
+    assert pool.calls == 3
+
+
+class FakeStreamedResponse(FakeHttpResponse):
+    """ A streamed response whose body breaks off after the given number of bytes """
+    def __init__(self, content, broken_at=None):
+        super().__init__(200, content)
+        self.broken_at = broken_at
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        end = len(self.content) if self.broken_at is None else self.broken_at
+        for start in range(0, end, chunk_size):
+            yield self.content[start:min(start + chunk_size, end)]
+        if self.broken_at is not None:
+            raise requests.exceptions.ChunkedEncodingError("connection reset")
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+SECTIONS = [{"id": s, "name": f"Week {s}", "modules": [{"id": 10 * s, "contents": [{"filename": f"{s}.pdf"}]}]}
+            for s in range(3)]
+
+
+def test_walk_streamed(monkeypatch):
+    body = json.dumps(SECTIONS).encode()
+    # the first response breaks off in the second section, the contents are fetched again
+    first = FakeStreamedResponse(body, broken_at=len(json.dumps(SECTIONS[:1])) + 10)
+    pool = FakePool([first, FakeHttpResponse(200, body)])
+    server = moodle.MoodleInstance("https://moodle.invalid", "token", pool)
+    monkeypatch.setattr(moodle.MoodleInstance, "stream_chunk_size", 16)
+
+    items = list(server.walk([{"id": 1, "shortname": "ALG"}]))
+    assert [kind for kind, _ in items] == [moodle.Kind.COURSE] + [
+        moodle.Kind.SECTION, moodle.Kind.MODULE, moodle.Kind.CONTENT] * 3
+    assert [item["name"] for kind, item in items if kind == moodle.Kind.SECTION] == ["Week 0", "Week 1", "Week 2"]
+    assert items[0][1]["timesynced"] is not None
+    assert first.closed and pool.calls == 2
+
+    error = b'{"exception":"moodle_exception","errorcode":"invalidrecord","message":"Not found"}'
+    pool.responses = [FakeStreamedResponse(error)]
+    assert list(server.walk([{"id": 1, "shortname": "ALG"}])) == [
+        (moodle.Kind.COURSE, {"id": 1, "shortname": "ALG", "timesynced": None, "incremental": False})]
+
+
+class EmptyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"[]")
+
+
+def test_pool_stats():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), EmptyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        for keep_alive, expected in [(True, {"hits": 4, "misses": 1}), (False, {"hits": 0, "misses": 5})]:
+            pool = moodle.HttpPool(keep_alive=keep_alive)
+            for _ in range(5):
+                pool.post(url).content
+            assert pool.stats() == expected
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_walk_bad_body():
+    html = b"<html><body>Site under maintenance</body></html>"
+    body = json.dumps(SECTIONS).encode()
+    truncated = b'[{"id": 1, "name"'
+    # the contents are streamed, if that fails they are fetched again at once
+    pool = FakePool([FakeStreamedResponse(html), FakeHttpResponse(200, html),
+                     FakeStreamedResponse(truncated), FakeHttpResponse(200, truncated),
+                     FakeStreamedResponse(body)])
+    server = moodle.MoodleInstance("https://moodle.invalid", "token", pool)
+
+    courses = [item for kind, item in server.walk([{"id": c} for c in (1, 2, 3)], max_workers=1)
+               if kind == moodle.Kind.COURSE]
+    # the first two failed, one is not JSON, the other is truncated
+    assert [course["timesynced"] is not None for course in courses] == [False, False, True]
+
+    pool.responses = [FakeHttpResponse(200, html)]
+    assert server.get_userid() is None
+
+
+def test_walk_cached(tmp_path):
+    responses = cache.ResponseCache(tmp_path)
+    server = moodle.MoodleInstance("https://moodle.invalid", "token", FakePool([]), responses)
+    params = moodle.encode_params({"courseid": "1"})
+    key = cache.ResponseCache.key("https://moodle.invalid", "token", "core_course_get_contents", params)
+    responses.put(key, "core_course_get_contents", json.dumps(SECTIONS).encode())
+    # received from the server 8 minutes ago, still fresh
+    header, body = responses._path(key).read_bytes().split(b"\n", 1)
+    header = dict(json.loads(header), time=time.time() - 8 * 60)
+    responses._path(key).write_bytes(json.dumps(header).encode() + b"\n" + body)
+
+    courses = [item for kind, item in server.walk([{"id": 1}]) if kind == moodle.Kind.COURSE]
+    assert server.api.pool.calls == 0
+    # the changes of the last 8 minutes are fetched by the next walk
+    assert courses[0]["timesynced"] <= time.time() - 13 * 60
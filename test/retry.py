@@ -0,0 +1,59 @@
+import pytest
+
+from muddle import retry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_delay():
+    policy = retry.RetryPolicy(backoff=1, backoff_max=10)
+    for attempt in range(10):
+        assert 0 <= policy.delay(attempt) <= min(10, 2 ** attempt)
+
+    # the server knows best, within reason
+    assert policy.delay(0, retry_after=5) >= 5
+    assert policy.delay(0, retry_after=3600) == 10
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = retry.TokenBucket(rate=2, burst=3, clock=clock, sleep=clock.sleep)
+
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == 0
+
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.now == pytest.approx(2)
+
+
+def test_circuit_breaker():
+    clock = FakeClock()
+    breaker = retry.CircuitBreaker(threshold=2, reset_timeout=30, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    # one trial call after the timeout
+    clock.now = 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
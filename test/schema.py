@@ -0,0 +1,49 @@
+from muddle import moodle
+from muddle.moodle import Kind
+
+
+SECTION = {
+    "id": 10, "name": "Week 1", "section": 1, "summary": "", "visible": 1, "uservisible": True,
+    "modules": [
+        {"id": 100, "name": "Slides", "modname": "resource", "contents": [
+            {"type": "file", "filename": "a.pdf", "filepath": "/", "filesize": 100,
+             "fileurl": "https://moodle.invalid/a.pdf", "timemodified": 1, "mimetype": "application/pdf"}]},
+        {"id": 101, "name": "Handouts", "modname": "folder", "contents": [
+            {"type": "file", "filename": "b.pdf", "filepath": "/week1/", "filesize": 200,
+             "fileurl": "https://moodle.invalid/b.pdf", "timemodified": 2}]},
+        {"id": 102, "name": "Wiki", "modname": "url", "contents": [
+            {"type": "url", "filename": "Wiki", "fileurl": "https://wiki.invalid"}]},
+        {"id": 103, "name": "Welcome", "modname": "label"},
+    ],
+}
+
+
+def test_fromdict():
+    section = moodle.Section._fromdict(SECTION)
+    assert (section.id, section.name, section.course) == (10, "Week 1", None)
+
+    resource, folder, url, label = section.modules
+    assert type(resource) is moodle.Module
+    assert resource.contents == [moodle.File("file", "a.pdf", "https://moodle.invalid/a.pdf", 100, 1, "/",
+                                             "application/pdf")]
+
+    assert type(folder) is moodle.Folder
+    assert [(directory, f.filename) for directory, f in folder.files()] == [("week1", "b.pdf")]
+
+    assert type(url.contents[0]) is moodle.ExternalLink
+    assert url.contents[0].fileurl == "https://wiki.invalid"
+    assert label.contents == ()
+
+    # slotted, no per object dictionary
+    assert not hasattr(section, "__dict__") and not hasattr(folder, "__dict__")
+
+
+def test_typed():
+    items = [(Kind.COURSE, {"id": 1, "shortname": "ALG", "timesynced": 5.0}), (Kind.SECTION, SECTION)]
+    items += [(Kind.MODULE, m) for m in SECTION["modules"][:1]] + [(Kind.CONTENT, SECTION["modules"][0]["contents"][0])]
+
+    course, section, module, content = [item for _, item in moodle.typed(items)]
+    assert (course.shortname, course.timesynced, course.incremental) == ("ALG", 5.0, False)
+    # the children are yielded on their own, not decoded twice
+    assert section.modules == () and module.contents == ()
+    assert isinstance(content, moodle.File) and content.filename == "a.pdf"
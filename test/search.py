@@ -0,0 +1,33 @@
+import pytest
+
+from muddle import search
+
+
+@pytest.fixture
+def index():
+    index = search.TitleIndex()
+    index.add(1, "Lecture 01 - Linear Algebra.pdf")
+    index.add(2, "Exercises: linear maps")
+    index.add(3, "Exam 2021")
+    return index
+
+
+def test_search(index):
+    assert index.search("linear") == {1, 2}
+    assert index.search("LIN alg") == {1}
+    assert index.search("ear") == {1, 2}
+    assert index.search("ex") == {2, 3}
+    assert index.search("nothing") == set()
+    assert index.search(" - ") is None
+
+
+def test_update(index):
+    index.add(3, "Linear exam")
+    assert index.search("linear") == {1, 2, 3}
+    assert index.search("2021") == set()
+
+    index.remove(1)
+    index.remove(2)
+    assert index.search("lin") == {3}
+    assert "algebra" not in index.postings
+    assert "lge" not in index.trigrams
@@ -0,0 +1,87 @@
+from muddle import sync
+from muddle.moodle import Kind
+
+
+ITEMS = [
+    (Kind.COURSE, {"id": 1, "shortname": "Algebra"}),
+    (Kind.SECTION, {"id": 2, "name": "Week 1"}),
+    (Kind.MODULE, {"id": 3, "name": "Slides", "modname": "resource"}),
+    (Kind.CONTENT, {"type": "file", "filename": "a.pdf", "fileurl": "https://moodle.invalid/a.pdf",
+                    "filesize": 3, "timemodified": 100}),
+    (Kind.CONTENT, {"type": "url", "filename": "link", "fileurl": "https://example.com"}),
+    (Kind.SECTION, {"id": 4, "name": "Week 2"}),
+    (Kind.MODULE, {"id": 5, "name": "Notes &amp; more", "modname": "resource"}),
+    (Kind.CONTENT, {"type": "file", "filename": "b.pdf", "fileurl": "https://moodle.invalid/b.pdf",
+                    "filesize": 3, "timemodified": 200}),
+]
+
+
+class FakeDownloader:
+    def __init__(self):
+        self.downloaded = []
+
+    def download(self, jobs, on_bytes=None, on_done=None):
+        for job in jobs:
+            job.path.parent.mkdir(parents=True, exist_ok=True)
+            job.path.write_bytes(b"pdf")
+            self.downloaded.append(job.url)
+            on_done(job, None)
+        return []
+
+
+def test_collect_jobs(tmp_path):
+    jobs = list(sync.collect_jobs(tmp_path, ITEMS))
+    assert [job.path for job in jobs] == [
+        tmp_path.joinpath("Algebra", "Week 1", "Slides", "a.pdf"),
+        tmp_path.joinpath("Algebra", "Week 2", "Notes & more", "b.pdf"),
+    ]
+    assert jobs[1].timemodified == 200
+
+
+def test_collect_jobs_folder(tmp_path):
+    items = ITEMS[:2] + [(Kind.MODULE, {"id": 6, "name": "Exercises", "modname": "folder"})] + [
+        (Kind.CONTENT, {"type": "file", "filename": "task.pdf", "filepath": f"/{week}/",
+                        "fileurl": f"https://moodle.invalid/{week}/task.pdf", "filesize": 3, "timemodified": 100})
+        for week in ("week1", "week2")]
+
+    jobs = list(sync.collect_jobs(tmp_path, items))
+    assert [job.path for job in jobs] == [
+        tmp_path.joinpath("Algebra", "Week 1", "Exercises", "week1", "task.pdf"),
+        tmp_path.joinpath("Algebra", "Week 1", "Exercises", "week2", "task.pdf"),
+    ]
+
+    # both are recorded, the second sync has nothing to do
+    downloader = FakeDownloader()
+    sync.mirror(downloader, sync.Manifest(tmp_path), jobs)
+    failed, skipped = sync.mirror(FakeDownloader(), sync.Manifest(tmp_path), sync.collect_jobs(tmp_path, items))
+    assert len(downloader.downloaded) == 2 and len(skipped) == 2
+
+
+def test_mirror_skips_unchanged(tmp_path):
+    downloader = FakeDownloader()
+    sync.mirror(downloader, sync.Manifest(tmp_path), sync.collect_jobs(tmp_path, ITEMS))
+    assert len(downloader.downloaded) == 2
+
+    # b.pdf changed on moodle, a.pdf was deleted locally
+    items = list(ITEMS)
+    items[-1] = (Kind.CONTENT, dict(items[-1][1], timemodified=300))
+    tmp_path.joinpath("Algebra", "Week 1", "Slides", "a.pdf").unlink()
+
+    downloader = FakeDownloader()
+    failed, skipped = sync.mirror(downloader, sync.Manifest(tmp_path), sync.collect_jobs(tmp_path, items))
+    assert sorted(downloader.downloaded) == ["https://moodle.invalid/a.pdf", "https://moodle.invalid/b.pdf"]
+
+    downloader = FakeDownloader()
+    failed, skipped = sync.mirror(downloader, sync.Manifest(tmp_path), sync.collect_jobs(tmp_path, items))
+    assert downloader.downloaded == []
+    assert len(skipped) == 2
+
+
+def test_filters(tmp_path):
+    courses = [{"id": 1, "shortname": "ALG", "fullname": "Algebra"},
+               {"id": 2, "shortname": "PHY", "fullname": "Physics"}]
+    assert sync.filter_courses(courses, ["alg*"]) == courses[:1]
+    assert sync.filter_courses(courses, ["2"]) == courses[1:]
+
+    jobs = list(sync.collect_jobs(tmp_path, ITEMS))
+    assert list(sync.filter_jobs(jobs, tmp_path, include=["*.pdf"], exclude=["*/Week 1/*"])) == jobs[1:]
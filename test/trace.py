@@ -0,0 +1,38 @@
+import json
+import threading
+
+from muddle import trace
+
+
+def test_off():
+    assert not trace.enabled()
+    with trace.span("nothing", a=1) as span:
+        span.set(b=2)
+    assert trace.stop() == []
+
+
+def test_save(tmp_path):
+    @trace.traced()
+    def work():
+        with trace.span("inner", size=3) as span:
+            span.set(done=True)
+
+    trace.start()
+    try:
+        work()
+        thread = threading.Thread(target=lambda: (trace.thread_name("worker"), work()))
+        thread.start()
+        thread.join()
+    finally:
+        trace.save(tmp_path.joinpath("trace.json"))
+
+    assert not trace.enabled()
+    events = json.loads(tmp_path.joinpath("trace.json").read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    assert [e["name"] for e in spans] == ["inner", "test_save.<locals>.work"] * 2
+    assert spans[0]["args"] == {"size": 3, "done": True}
+    assert spans[0]["tid"] != spans[2]["tid"]
+    assert spans[1]["ts"] <= spans[0]["ts"] and spans[0]["dur"] <= spans[1]["dur"]
+
+    names = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    assert names[spans[2]["tid"]] == "worker"